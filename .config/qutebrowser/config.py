@@ -8,11 +8,9 @@
 #
 
 
-import os
-wal_config = os.path.expanduser("~/.cache/wal/qutebrowser-config.py")
-if os.path.exists(wal_config):
-    with open(wal_config, "r") as f:
-        exec(f.read())
+# Pywal colors, compiled once and only the changed ones applied (see wal_theme.py)
+import wal_theme
+wal_theme.load(config)
 
 # Load existing settings made via :set
 config.load_autoconfig()
@@ -0,0 +1,116 @@
+"""
+wal_theme: load pywal's qutebrowser theme (~/.cache/wal/qutebrowser-config.py)
+
+The generated theme is compiled once and its code object marshalled next to
+it, keyed by the file's mtime and size (and its hash, so a rewrite with the
+same content is not compiled again). Running it records the settings it
+assigns, and only those that differ from the current values are set: a
+:config-source after a new wallpaper changes the colors, nothing else.
+
+Run directly to compare with exec(f.read()): python3 wal_theme.py [rounds]
+"""
+import os
+import sys
+import marshal
+import hashlib
+import importlib.util
+
+THEME = os.path.expanduser("~/.cache/wal/qutebrowser-config.py")
+MAGIC = importlib.util.MAGIC_NUMBER  # marshal is only readable by the same Python
+
+class Settings:
+    """Stands in for c: c.colors.tabs.bar.bg = x records "colors.tabs.bar.bg" """
+
+    def __init__(self, values, prefix=""):
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "_prefix", prefix)
+
+    def __getattr__(self, name):
+        return Settings(self._values, self._prefix + name + ".")
+
+    def __setattr__(self, name, value):
+        self._values[self._prefix + name] = value
+
+def code_for(path):
+    """The compiled theme, from the marshal cache when the file is the same"""
+    cache = path + ".marshal"
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(cache, "rb") as c:
+                magic, cached_stamp, digest, code = marshal.load(c)
+            if magic == MAGIC and cached_stamp == stamp:
+                return code
+        except (OSError, ValueError, EOFError, TypeError):
+            digest = None
+        source = f.read()
+    if hashlib.sha256(source).hexdigest() != digest:
+        digest = hashlib.sha256(source).hexdigest()
+        code = compile(source, path, "exec")
+    tmp = f"{cache}.{os.getpid()}"
+    try:
+        with open(tmp, "wb") as c:
+            marshal.dump((MAGIC, stamp, digest, code), c)
+        os.replace(tmp, cache)
+    except OSError:
+        pass  # a read-only cache only costs the compile next time
+    return code
+
+def load(config, path=THEME):
+    """Apply the theme at path through config; the settings that changed"""
+    if not os.path.exists(path):
+        return []
+    values = {}
+    exec(code_for(path), {"c": Settings(values), "config": config})
+    changed = []
+    for name, value in values.items():
+        if config.get(name) != value:
+            config.set(name, value)
+            changed.append(name)
+    return changed
+
+def bench(rounds=200):
+    import time
+    import tempfile
+
+    class Config:
+        def __init__(self):
+            self.values = {}
+
+        def get(self, name):
+            return self.values.get(name)
+
+        def set(self, name, value):
+            self.values[name] = value
+
+    if not os.path.exists(THEME):
+        print(f"{THEME} not found", file=sys.stderr)
+        return 1
+    with tempfile.TemporaryDirectory() as tmp:
+        theme = os.path.join(tmp, "theme.py")
+        with open(THEME) as f:
+            source = f.read().replace("config.load_autoconfig()", "")
+        with open(theme, "w") as f:
+            f.write(source)
+
+        def timed(run):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                run()
+            return (time.perf_counter() - start) / rounds * 1000
+
+        def exec_source():
+            config = Config()
+            with open(theme) as f:
+                exec(f.read(), {"c": Settings(config.values), "config": config})
+
+        config = Config()
+        print(f"exec(f.read())        {timed(exec_source):6.3f}ms")
+        print(f"load, fresh config    {timed(lambda: load(Config(), theme)):6.3f}ms")
+        print(f"reload, no changes    {timed(lambda: load(config, theme)):6.3f}ms")
+        print(f"{len(config.values)} settings, {len(load(Config(), theme))} set on a fresh config")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(bench(*[int(a) for a in sys.argv[1:2]]))
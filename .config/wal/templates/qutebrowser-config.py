@@ -1,8 +1,7 @@
 # Qutebrowser pywal template with improved command palette contrast
 # Save this as ~/.config/wal/templates/qutebrowser-config.py
 
-# Load existing settings
-config.load_autoconfig()
+# config.py loads autoconfig.yml; this file only sets colors
 
 # Colors generated by pywal
 base16 = {{
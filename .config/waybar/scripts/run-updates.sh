@@ -88,7 +88,7 @@ if [ -z "$updates" ]; then
     echo -e "${YELLOW}Press Enter to close...${RESET}"
     stty sane  # Reset terminal settings
     read -r
-    ~/.config/waybar/scripts/check-updates.sh force
+    python3 ~/.config/waybar/scripts/update_check.py force
     rm -f "$LOCKFILE"
     exit 0
 fi
@@ -116,7 +116,7 @@ case "$response" in
         ;;
     *)
         echo -e "${RED}Update cancelled${RESET}"
-        ~/.config/waybar/scripts/check-updates.sh force
+        python3 ~/.config/waybar/scripts/update_check.py force
         rm -f "$LOCKFILE"
         exit 0
         ;;
@@ -151,7 +151,7 @@ if wait $update_pid; then
     echo -e "${GREEN}[✔] Update complete${RESET}"
 else
     echo -e "${RED}[✘] Update failed. Check ~/.cache/updates/last-update.txt for details${RESET}"
-    ~/.config/waybar/scripts/check-updates.sh force
+    python3 ~/.config/waybar/scripts/update_check.py force
     rm -f "$LOCKFILE"
     exit 1
 fi
@@ -160,7 +160,7 @@ fi
 # -----------------------------
 # Run waybar script
 # -----------------------------
-~/.config/waybar/scripts/check-updates.sh force
+python3 ~/.config/waybar/scripts/update_check.py force
 
 # -----------------------------
 # Wait for user to exit
@@ -6,15 +6,24 @@ import time
 import atexit
 import signal
 import fcntl
-import re
+import json
+import socket
 from pathlib import Path
 
 LOCKFILE = Path("/tmp/run-updates.lock")
 CACHE_DIR = Path.home() / ".cache/updates"
 UPDATE_LOG = CACHE_DIR / "last-update.txt"
-WAYBAR_SCRIPT = Path.home() / ".config/waybar/scripts/check-updates.sh"
 NOTIFY_COOLDOWN = 3  # seconds between notifications
-NOTIFY_FILE = LOCKFILE.with_suffix(".notify")
+# Launch and notification times, shared by every click under one flock
+STATE_FILE = LOCKFILE.with_suffix(".state")
+LAUNCH_GRACE = 5  # seconds a launched window has to take LOCKFILE
+TERMINAL = os.environ.get("UPDATE_TERMINAL", "kitty")
+# A kitty remote control socket ("unix:/path" or "unix:@abstract") to open
+# the window from instead of starting a new kitty; needs allow_remote_control
+KITTY_SOCKET = os.environ.get("UPDATE_KITTY_SOCKET")
+USE_PTY = os.environ.get("UPDATE_PTY", "1") != "0"  # 0 reads paru through a plain pipe
+# 1 downloads and builds everything before installing anything, see update_pipeline.py
+USE_PIPELINE = os.environ.get("UPDATE_PIPELINE", "0") == "1"
 
 # -----------------------------
 # Colors
@@ -29,55 +38,185 @@ RESET = "\033[0m"
 # -----------------------------
 # Headless launcher
 # -----------------------------
-if not os.environ.get("INSIDE_KITTY"):
-    # Temporary lock to prevent multiple launches
-    temp_lockfile = LOCKFILE.with_suffix(".tmp")
-    temp_fd = open(temp_lockfile, "w")
+class LaunchState:
+    """STATE_FILE as a dict, read and written back under an exclusive flock"""
+
+    def __enter__(self):
+        self.fd = os.open(STATE_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            self.state = json.loads(os.pread(self.fd, 4096, 0) or b"{}")
+        except ValueError:
+            self.state = {}
+        self.saved = dict(self.state)
+        return self.state
+
+    def __exit__(self, *exc):
+        try:
+            if self.state != self.saved:
+                data = json.dumps(self.state).encode()
+                os.pwrite(self.fd, data, 0)
+                os.ftruncate(self.fd, len(data))
+        finally:
+            os.close(self.fd)  # also drops the lock
+
+def notify_running(state):
+    """Tell the user an update is already running, at most every NOTIFY_COOLDOWN"""
+    now = time.time()
+    if now - state.get("notified", 0) >= NOTIFY_COOLDOWN:
+        subprocess.run([
+            "notify-send",
+            "Update already running",
+            "Please wait for the current update to finish."
+        ])
+        state["notified"] = now
+
+def update_running():
+    """Whether an update window holds LOCKFILE"""
+    fd = os.open(LOCKFILE, os.O_RDWR | os.O_CREAT, 0o600)
     try:
-        fcntl.flock(temp_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
     except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def launch_via_socket(argv, env):
+    """Open an OS window in a running kitty over remote control; False if that failed"""
+    address = KITTY_SOCKET.removeprefix("unix:")
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    command = {"cmd": "launch", "version": [0, 26, 0], "no_response": False, "payload": {
+        "type": "os-window", "os_window_class": "updates", "window_title": "Arch Updates",
+        "cwd": os.getcwd(), "env": [f"{k}={v}" for k, v in env.items()], "args": argv}}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(address)
+            sock.sendall(b"\x1bP@kitty-cmd" + json.dumps(command).encode() + b"\x1b\\")
+            reply = sock.recv(65536)
+    except OSError:
+        return False
+    return b'"ok": true' in reply or b'"ok":true' in reply
+
+# What a click did before update.py exec'd the terminal itself
+LEGACY_LAUNCHER = """
+import subprocess, sys, os
+from pathlib import Path
+wrapper = Path(sys.argv[3])
+wrapper.write_text(f'#!/bin/bash\\ncd "{os.getcwd()}"\\npython3 "{sys.argv[1]}"\\n')
+wrapper.chmod(0o755)
+os.environ["INSIDE_KITTY"] = "1"
+subprocess.run([sys.argv[2], "--class", "updates", "--title", "Arch Updates", str(wrapper)])
+wrapper.unlink()
+"""
+
+def bench_launch(rounds=5):
+    """Click-to-terminal latency of the old bash wrapper and of the exec launcher"""
+    import tempfile
+    script = os.path.abspath(__file__)
+    with tempfile.TemporaryDirectory() as tmp:
+        probe = Path(tmp) / "probe"
+        env = dict(os.environ, UPDATE_LAUNCH_PROBE=str(probe))
+        env.pop("INSIDE_KITTY", None)
+        modes = {
+            "wrapper": [sys.executable, "-c", LEGACY_LAUNCHER, script, TERMINAL, f"{tmp}/update-wrapper.sh"],
+            "exec": [sys.executable, script],
+        }
+        for mode, argv in modes.items():
+            samples = []
+            for _ in range(rounds):
+                probe.unlink(missing_ok=True)
+                start = time.time()
+                proc = subprocess.Popen(argv, env=env)
+                while not probe.exists() and time.time() - start < 15:
+                    time.sleep(0.002)
+                if probe.exists():
+                    samples.append(float(probe.read_text() or 0) - start)
+                proc.wait()
+            if not samples:
+                print(f"{mode:<8} no window came up (is an update running?)")
+                continue
+            samples.sort()
+            print(f"{mode:<8} click to terminal: p50 {samples[len(samples) // 2] * 1000:.0f}ms, "
+                  f"max {samples[-1] * 1000:.0f}ms over {len(samples)} runs")
+    return 0
+
+if sys.argv[1:2] == ["--bench-launch"]:
+    sys.exit(bench_launch(*[int(a) for a in sys.argv[2:3]]))
+
+# -----------------------------
+# Open the update window
+# -----------------------------
+if not os.environ.get("INSIDE_KITTY") and not sys.argv[1:]:
+    with LaunchState() as state:
         now = time.time()
-        last_time = 0
-        if NOTIFY_FILE.exists():
-            try:
-                last_time = float(NOTIFY_FILE.read_text().strip())
-            except Exception:
-                last_time = 0
-        if now - last_time >= NOTIFY_COOLDOWN:
-            subprocess.run([
-                "notify-send",
-                "Update already running",
-                "Please wait for the current update to finish."
-            ])
-            NOTIFY_FILE.write_text(str(now))
-        sys.exit(0)
+        if update_running() or now - state.get("launched", 0) < LAUNCH_GRACE:
+            notify_running(state)
+            sys.exit(0)
+        state["launched"] = now
 
+    # Straight into the interpreter inside the terminal: no wrapper script,
+    # no bash, and this process becomes the terminal instead of waiting on it
+    argv = [sys.executable, os.path.abspath(__file__)]
+    if KITTY_SOCKET and launch_via_socket(argv, {"INSIDE_KITTY": "1"}):
+        sys.exit(0)
     os.environ["INSIDE_KITTY"] = "1"
+    os.execvp(TERMINAL, [TERMINAL, "--class", "updates", "--title", "Arch Updates", *argv])
 
-    # Simplified wrapper - just run the Python script
-    wrapper_script = f'''#!/bin/bash
-cd "{os.getcwd()}"
-python3 "{__file__}"
-'''
-    wrapper_path = Path("/tmp/update-wrapper.sh")
-    wrapper_path.write_text(wrapper_script)
-    wrapper_path.chmod(0o755)
+# Only the update window needs these; the launcher above stays light
+from update_check import (PARU, PACMAN, SYNC_MAX_AGE, db_mtimes, read_pending,
+                          write_pending, pending_is_fresh, parse_updates)
+from update_progress import ProgressParser, BufferedLog, ChildOutput, package_sizes, format_size
+from update_pipeline import Pipeline, SUDO, cached_builds
+from update_cache import store_paru_builds
+from update_history import record, history, stats
 
-    try:
-        subprocess.run([
-            "kitty",
-            "--class", "updates",
-            "--title", "Arch Updates",
-            str(wrapper_path)
-        ], check=True)
-    finally:
-        if wrapper_path.exists():
-            wrapper_path.unlink()
-        fcntl.flock(temp_fd, fcntl.LOCK_UN)
-        temp_fd.close()
-        temp_lockfile.unlink(missing_ok=True)
+# -----------------------------
+# Pending package cache
+# -----------------------------
+def query_pending():
+    """Ask paru for pending updates, syncing only stale DBs; None if the sync failed"""
+    oldest_sync, _ = db_mtimes()
+    if time.time() - oldest_sync >= SYNC_MAX_AGE:
+        sync = subprocess.run([PARU, "-Sy"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if sync.returncode != 0:
+            return None
+    updates = subprocess.run([PARU, "-Qu"], capture_output=True, text=True)
+    foreign = set(subprocess.run([PACMAN, "-Qqm"], capture_output=True, text=True).stdout.split())
+    packages = [p._replace(source="aur") if p.name in foreign else p
+                for p in parse_updates(updates.stdout, "repo")]
+    write_pending(packages)
+    return packages
+
+def pending_updates():
+    """(packages, time of the cached check or None) using the shared cache when fresh"""
+    cached = read_pending()
+    if cached and pending_is_fresh(cached[0]):
+        return cached[1], cached[0]
+    return query_pending(), None
+
+def format_pending(packages):
+    return "\n".join(f"{name} {old} -> {new}" + (" [aur]" if source == "aur" else "")
+                     for name, old, new, source in packages)
+
+# Print the pending list without launching anything
+if sys.argv[1:] == ["--pending"]:
+    packages, cached = pending_updates()
+    if packages is None:
+        print("Failed to sync package databases", file=sys.stderr)
+        sys.exit(1)
+    print(format_pending(packages) or "No updates available")
+    print(f"({'cached' if cached else 'fresh'}: {len(packages)} pending)", file=sys.stderr)
     sys.exit(0)
 
+# Past runs, from the history database
+if sys.argv[1:2] == ["--history"] and len(sys.argv) <= 3:
+    sys.exit(history(*[int(a) for a in sys.argv[2:]]))
+if sys.argv[1:] == ["--stats"]:
+    sys.exit(stats())
+
 # -----------------------------
 # Now inside Kitty - acquire main lock
 # -----------------------------
@@ -85,21 +224,28 @@ lock_fd = open(LOCKFILE, "w")
 try:
     fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
 except BlockingIOError:
-    subprocess.run([
-        "notify-send",
-        "Update already running",
-        "Please wait for the current update to finish."
-    ])
+    with LaunchState() as state:
+        notify_running(state)
     sys.exit(1)
 
+# The window is up and holds the lock, so the next click may launch again
+# as soon as this one is done
+with LaunchState() as state:
+    state.pop("launched", None)
+
+# Click-to-terminal probe for --bench-launch: report and close right away
+if os.environ.get("UPDATE_LAUNCH_PROBE"):
+    Path(os.environ["UPDATE_LAUNCH_PROBE"]).write_text(str(time.time()))
+    sys.exit(0)
+
 def cleanup():
     """Release lockfile on exit."""
+    # LOCKFILE itself stays: unlinking it would let a launcher lock a fresh
+    # inode while another process still holds the old one
     try:
         fcntl.flock(lock_fd, fcntl.LOCK_UN)
     except Exception:
         pass
-    if LOCKFILE.exists():
-        LOCKFILE.unlink()
     lock_fd.close()
 
 atexit.register(cleanup)
@@ -109,18 +255,22 @@ signal.signal(signal.SIGINT, lambda s, f: sys.exit(0))
 # -----------------------------
 # Progress bar function
 # -----------------------------
-def update_progress_bar(current, total, bar_width=35):
-    """Display a progress bar with current/total packages."""
+def update_progress_bar(parser, bar_width=35):
+    """Display a byte-weighted progress bar for the current phase, with an ETA."""
+    phase, done, total, eta = parser.progress()
     if total == 0:
         filled = 0
     else:
-        filled = int(bar_width * current / total)
+        filled = int(bar_width * done / total)
     
     empty = bar_width - filled
     bar = "|" * filled + " " * empty
-    percentage = int(100 * current / total) if total > 0 else 0
+    percentage = int(100 * done / total) if total > 0 else 0
+    remaining = f" ETA {int(eta) // 60}:{int(eta) % 60:02d}" if eta is not None else ""
     
-    print(f"\r{CYAN}[{bar}]{RESET} ({current}/{total}) {percentage}%", end="", flush=True)
+    # \033[K clears what a longer previous line left behind
+    print(f"\r{CYAN}[{bar}]{RESET} {phase} {percentage}%{remaining} "
+          f"({parser.completed}/{parser.total})\033[K", end="", flush=True)
 
 # -----------------------------
 # Fancy title
@@ -135,14 +285,15 @@ print(f"{YELLOW}Date:{RESET} {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
 # Fetch updates
 # -----------------------------
 print(f"{BOLD}Fetching update information...{RESET}")
-sync = subprocess.run(["paru", "-Sy"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-if sync.returncode != 0:
+packages, cached = pending_updates()
+if packages is None:
     print(f"{RED}Failed to sync package databases{RESET}")
     input("Press Enter to close...")
     sys.exit(1)
+if cached:
+    print(f"{CYAN}Using the update list checked {int((time.time() - cached) / 60)} min ago{RESET}")
 
-updates = subprocess.run(["paru", "-Qu"], capture_output=True, text=True)
-updates_list = updates.stdout.strip().splitlines()
+updates_list = format_pending(packages).splitlines()
 
 if not updates_list:
     print(f"{GREEN}No updates available{RESET}")
@@ -154,7 +305,12 @@ if not updates_list:
 # -----------------------------
 print(f"{YELLOW}Packages that need updating:{RESET}")
 print("\n".join(updates_list))
-print(f"\n{YELLOW}Total packages to update: {len(updates_list)}{RESET}\n")
+sizes = package_sizes([name for name, _, _, _ in packages])
+print(f"\n{YELLOW}Total packages to update: {len(updates_list)}{RESET}")
+if sizes:
+    print(f"{YELLOW}Download: {format_size(sum(d for d, _ in sizes.values()))}, "
+          f"installed: {format_size(sum(i for _, i in sizes.values()))}{RESET}")
+print()
 
 # -----------------------------
 # Ask for confirmation
@@ -177,96 +333,72 @@ CACHE_DIR.mkdir(parents=True, exist_ok=True)
 # -----------------------------
 print(f"{BOLD}Updating packages...{RESET}")
 
-total_packages = len(updates_list)
-completed_packages = 0
-
-# Pattern to match package installation/upgrade messages
-install_patterns = [
-    re.compile(r"installing (\S+)"),
-    re.compile(r"upgrading (\S+)"),
-    re.compile(r"reinstalling (\S+)"),
-    re.compile(r"\[(\d+)/(\d+)\]"),  # Sometimes paru shows [x/y] progress
-]
+parser = ProgressParser([name for name, _, _, _ in packages], sizes)
+update_progress_bar(parser)
+started, clock = time.time(), time.monotonic()
+build_seconds = {}
 
-update_progress_bar(completed_packages, total_packages)
+def report(text):
+    """Print a message above the progress bar"""
+    print(f"\r\033[K{CYAN}{text}{RESET}")
+    update_progress_bar(parser)
 
-proc = subprocess.Popen(
-    ["paru", "-Syu", "--noconfirm"],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-    universal_newlines=True,
-    bufsize=1
-)
+def stream(argv, logfile):
+    """Run argv, logging its output and following it on the progress bar"""
+    # On a pseudo-terminal paru reports per-package progress as \r-terminated updates
+    proc = ChildOutput(argv, USE_PTY)
+    for output in proc:
+        logfile.write(output)
+        if parser.feed(output):
+            update_progress_bar(parser)
+    return proc.returncode
 
 # Log file for debugging
-with UPDATE_LOG.open("w") as logfile:
-    while True:
-        if proc.stdout is None:
-            break
-        output = proc.stdout.readline()
-        if output == '' and proc.poll() is not None:
-            break
-        
-        if output:
-            # Write to log
-            logfile.write(output)
-            logfile.flush()
-            
-            # Check for progress indicators
-            line = output.strip().lower()
-            
-            # Look for package installation/upgrade messages
-            for pattern in install_patterns:
-                if pattern.search(line):
-                    # Check if this is a [x/y] pattern which gives us exact progress
-                    match = re.search(r"\[(\d+)/(\d+)\]", line)
-                    if match:
-                        current = int(match.group(1))
-                        total = int(match.group(2))
-                        if total == total_packages:  # Make sure it matches our expected total
-                            completed_packages = current
-                        else:
-                            # Estimate based on the pattern
-                            completed_packages = min(completed_packages + 1, total_packages)
-                    else:
-                        # Increment for other installation messages
-                        completed_packages = min(completed_packages + 1, total_packages)
-                    
-                    update_progress_bar(completed_packages, total_packages)
-                    break
-            
-            # Also look for other progress indicators
-            if any(keyword in line for keyword in ['downloading', 'checking', 'resolving']):
-                # Small progress for preparatory steps
-                if completed_packages == 0:
-                    update_progress_bar(0, total_packages)
-
-# Ensure we show 100% completion
-update_progress_bar(total_packages, total_packages)
+with BufferedLog(UPDATE_LOG) as logfile:
+    if USE_PIPELINE:
+        pipeline = Pipeline(packages, parser, logfile, update_progress_bar, report, use_pty=USE_PTY)
+        status = pipeline.run()
+        build_seconds = pipeline.build_seconds
+    else:
+        # AUR packages built before with the same PKGBUILD are installed from
+        # the artifact cache once paru upgraded everything else
+        aur = [name for name, _, _, source in packages if source == "aur"]
+        hits = cached_builds(aur) if aur else {}
+        for name in hits:
+            report(f"reusing {name} from the build cache")
+        ignore = [f"--ignore={','.join(hits)}"] if hits else []
+        status = stream([PARU, "-Syu", "--noconfirm", *ignore], logfile)
+        if status == 0 and hits:
+            status = stream([*SUDO, PACMAN, "-U", "--noconfirm", *[f for files in hits.values() for f in files]],
+                            logfile)
+        if status == 0:
+            store_paru_builds([name for name in aur if name not in hits])
+parser.close()
+update_progress_bar(parser)  # where it really ended, not a forced 100%
+
 print()  # New line after progress bar
 
+try:
+    record(started, time.monotonic() - clock, status, "pipeline" if USE_PIPELINE else "paru",
+           packages, parser, sizes, build_seconds)
+except Exception as e:  # sqlite3.Error, or an unwritable state directory
+    print(f"{YELLOW}Warning: Could not record update history: {e}{RESET}")
+
 # -----------------------------
 # Handle update completion
 # -----------------------------
-update_performed = False
-
-if proc.returncode == 0:
+if status == 0:
     print(f"{GREEN}[✔] Update complete{RESET}")
-    update_performed = True
+    # Nothing is pending any more: publish that instead of checking again.
+    # update_check.py watch sees the list change and refreshes waybar.
+    write_pending([])
 else:
+    # The watcher prunes whatever did get installed from the list
     print(f"{RED}[✘] Update failed. Check {UPDATE_LOG} for details{RESET}")
 
 # Always ask user to press Enter before closing
 print(f"\n{BOLD}Press Enter to close...{RESET}")
 input()
 
-# If updates were performed successfully, run waybar script with force flag
-if update_performed:
-    print(f"{CYAN}Refreshing waybar...{RESET}")
-    try:
-        subprocess.run([str(WAYBAR_SCRIPT), "force"], check=False)
-    except Exception as e:
-        print(f"{YELLOW}Warning: Could not refresh waybar: {e}{RESET}")
-
 print(f"{GREEN}Exiting update script.{RESET}")
 sys.exit(0)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+update_cache: built AUR packages, reused across upgrades and hosts
+Usage: update_cache.py list
+       update_cache.py check
+
+Built packages are stored under a key hashed from the PKGBUILD, .SRCINFO
+(which carries the source checksums), every other file of the AUR repo
+and the architecture, so an unchanged package is installed from the cache
+instead of being rebuilt. The directory can sit on a mounted share:
+entries appear by rename and are evicted least recently used first once
+the cache grows past its cap. VCS packages (-git and friends) are never
+cached, since their PKGBUILD stays the same while upstream moves.
+check runs update_pipeline against a dummy PKGBUILD and stub makepkg.
+"""
+import os
+import re
+import sys
+import time
+import fcntl
+import shutil
+import hashlib
+from pathlib import Path
+
+ARTIFACT_CACHE = Path(os.environ.get("UPDATE_AUR_CACHE", Path.home() / ".cache/updates/artifacts"))
+ARTIFACT_CACHE_MAX = int(os.environ.get("UPDATE_AUR_CACHE_MAX_MB", "4096")) << 20
+PARU_CLONE = Path(os.environ.get("UPDATE_PARU_CLONE", Path.home() / ".cache/paru/clone"))
+ARCH = os.uname().machine
+
+# source=() entries fetched from a VCS: "git+https://...", "foo::hg+..."
+VCS_SOURCE = re.compile(r"(?:^|::|['\"(\s])(?:git|hg|svn|bzr|fossil)\+")
+# What makepkg leaves in the build directory, as opposed to the AUR repo
+BUILD_OUTPUT = re.compile(r"\.pkg\.tar(?:\.\w+)?$|\.log$|\.(?:tar|t?gz|xz|zst|bz2|zip)$")
+
+def repo_files(workdir):
+    """
+    Files of the AUR repo in workdir: what git tracks, or without git every
+    file that is neither a build product nor a downloaded source archive.
+    Downloaded sources need no hashing, their checksums are in the PKGBUILD.
+    """
+    import subprocess
+    if (workdir / ".git").exists():
+        listed = subprocess.run(["git", "ls-files", "-z"], cwd=workdir, stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True)
+        if listed.returncode == 0:
+            return sorted(name for name in listed.stdout.split("\0") if name and (workdir / name).is_file())
+    return sorted(path.name for path in workdir.iterdir()
+                  if path.is_file() and not BUILD_OUTPUT.search(path.name))
+
+class ArtifactCache:
+    """Content-addressed store of package files: root/<key>/<file>"""
+
+    def __init__(self, root=ARTIFACT_CACHE, max_bytes=ARTIFACT_CACHE_MAX):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def key(self, workdir):
+        """Key of the package in workdir, or None when it must not be cached"""
+        workdir = Path(workdir)
+        try:
+            pkgbuild = (workdir / "PKGBUILD").read_bytes()
+        except OSError:
+            return None
+        srcinfo = workdir / ".SRCINFO"
+        sources = srcinfo.read_text(errors="replace") if srcinfo.exists() else pkgbuild.decode(errors="replace")
+        if VCS_SOURCE.search(sources):
+            return None
+        digest = hashlib.sha256(ARCH.encode() + b"\0")
+        for name in repo_files(workdir):
+            digest.update(name.encode() + b"\0" + (workdir / name).read_bytes() + b"\0")
+        return digest.hexdigest()[:32]
+
+    def lock(self):
+        """Exclusive lock on the cache, held while adding or evicting"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.root / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def fetch(self, key, dest):
+        """Copy the package files cached under key into dest; their paths, or None"""
+        entry = self.root / key
+        try:
+            names = sorted(os.listdir(entry))
+        except OSError:
+            return None
+        if not names:
+            return None
+        files = []
+        try:
+            for name in names:
+                target = Path(dest) / name
+                target.unlink(missing_ok=True)
+                try:
+                    os.link(entry / name, target)
+                except OSError:  # another filesystem, such as a mounted share
+                    shutil.copy2(entry / name, target)
+                files.append(str(target))
+        except OSError:
+            return None  # evicted under us
+        os.utime(entry)  # most recently used
+        return files
+
+    def store(self, key, files):
+        """Add files under key, then evict down to max_bytes"""
+        entry = self.root / key
+        fd = self.lock()
+        try:
+            if not entry.exists():
+                tmp = self.root / f".{key}.{os.getpid()}"
+                tmp.mkdir()
+                for path in files:
+                    shutil.copy2(path, tmp)
+                tmp.rename(entry)
+            os.utime(entry)
+            self.evict()
+        finally:
+            os.close(fd)
+
+    def entries(self):
+        """[(last used, bytes, key)] for every entry, least recently used first"""
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and not entry.name.startswith("."):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.name))
+        return sorted(entries)
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits; call under lock()"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.root / key, ignore_errors=True)
+            total -= size
+
+def packagelist(workdir, makepkg="makepkg"):
+    """Package files makepkg built in workdir, or None"""
+    import subprocess
+    listed = subprocess.run([makepkg, "--packagelist"], cwd=workdir, stdin=subprocess.DEVNULL,
+                            capture_output=True, text=True).stdout.split()
+    return [f for f in listed if os.path.exists(f)] or None
+
+def store_paru_builds(names, cache=None, makepkg="makepkg"):
+    """After paru -Syu, add what it built in its clone directory to the cache"""
+    cache = cache or ArtifactCache()
+    stored = []
+    for name in names:
+        workdir = PARU_CLONE / name
+        key = cache.key(workdir)
+        files = key and packagelist(workdir, makepkg)
+        if files:
+            cache.store(key, files)
+            stored.append(name)
+    return stored
+
+# -----------------------------
+# List and check
+# -----------------------------
+def list_entries(cache=None):
+    from update_progress import format_size
+    cache = cache or ArtifactCache()
+    if not cache.root.exists():
+        print(f"No cached packages in {cache.root}")
+        return 1
+    entries = cache.entries()
+    for used, size, key in reversed(entries):
+        files = " ".join(sorted(os.listdir(cache.root / key)))
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {format_size(size):>10}  {key}  {files}")
+    total = sum(size for _, size, _ in entries)
+    print(f"{len(entries)} entries, {format_size(total)} of {format_size(cache.max_bytes)}")
+    return 0
+
+DUMMY_PKGBUILD = """pkgname={name}
+pkgver=1
+pkgrel=1
+arch=(x86_64)
+source=({source})
+sha256sums=(SKIP)
+"""
+
+STUB_MAKEPKG = """#!/bin/sh
+name=$(basename "$PWD")
+if [ "$1" = --packagelist ]; then echo "$PWD/$name-1-1-x86_64.pkg.tar.zst"; exit 0; fi
+echo "$name" >> "{builds}"
+touch "$name-1.tar.gz"  # a downloaded source, which must not change the key
+sleep 0.5
+head -c 4096 /dev/zero > "$name-1-1-x86_64.pkg.tar.zst"
+"""
+
+STUB_PARU = """#!/bin/sh
+exit 0  # -G: the dummy repos are already in place
+"""
+
+STUB_PACMAN = """#!/bin/sh
+[ "$1" = -U ] && shift 2 && for f in "$@"; do echo "(1/1) upgrading $(basename "$f" -1-1-x86_64.pkg.tar.zst)"; done
+exit 0
+"""
+
+def check():
+    """Upgrade dummy AUR packages through the pipeline again and from a second host"""
+    import tempfile
+    import update_pipeline
+    from update_check import Package
+    from update_progress import ProgressParser
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        builds = tmp / "builds"
+        for name, script in (("makepkg", STUB_MAKEPKG), ("pacman", STUB_PACMAN), ("paru", STUB_PARU)):
+            (tmp / name).write_text(script.format(builds=builds))
+            (tmp / name).chmod(0o755)
+        update_pipeline.MAKEPKG, update_pipeline.PACMAN, update_pipeline.PARU, update_pipeline.SUDO = (
+            str(tmp / "makepkg"), str(tmp / "pacman"), str(tmp / "paru"), [])
+        sources = {"plain": "https://example.org/plain-1.tar.gz", "patched": "patched-1.tar.gz fix.patch",
+                   "vcs-git": "git+https://example.org/vcs.git"}
+        for host in ("a", "b"):
+            for name, source in sources.items():
+                workdir = tmp / host / name
+                workdir.mkdir(parents=True)
+                (workdir / "PKGBUILD").write_text(DUMMY_PKGBUILD.format(name=name, source=source))
+                if name == "patched":
+                    (workdir / "fix.patch").write_text(f"patch from host {host}\n" if host == "b" else "patch\n")
+
+        cache = ArtifactCache(tmp / "cache", max_bytes=3 * 4096)
+        packages = [Package(name, "0-1", "1-1", "aur") for name in sources]
+        took = {}
+        for run, host in enumerate(("a", "a", "b")):
+            parser = ProgressParser(list(sources))
+            start = time.monotonic()
+            with open(tmp / "log", "w") as log:
+                status = update_pipeline.Pipeline(packages, parser, log, lambda parser: None, lambda text: None,
+                                                  build_dir=tmp / host, workers=3, use_pty=False,
+                                                  cache=cache).run()
+            took[run] = time.monotonic() - start
+            parser.close()
+            if status or parser.completed != 3:
+                failures.append(f"run {run} on host {host}: exit {status}, {parser.completed}/3 upgraded")
+        built = sorted(builds.read_text().split())
+        if built != ["patched", "patched", "plain", "vcs-git", "vcs-git", "vcs-git"]:
+            failures.append(f"built {built}, expected plain once, patched twice, vcs-git every time")
+        keys = [key for _, _, key in cache.entries()]
+        if len(keys) != 3:
+            failures.append(f"{len(keys)} cache entries, expected plain and both patched")
+
+        # A third package over the cap pushes out the least recently used
+        (tmp / "extra.pkg.tar.zst").write_bytes(bytes(4096))
+        cache.max_bytes = 2 * 4096
+        oldest = keys and cache.entries()[0][2]
+        cache.store("extra", [tmp / "extra.pkg.tar.zst"])
+        left = [key for _, _, key in cache.entries()]
+        if oldest in left or "extra" not in left or len(left) != 2:
+            failures.append(f"eviction left {left}, expected {oldest} gone")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    print(f"first upgrade {took[0]:.2f}s, repeat {took[1]:.2f}s, on another host {took[2]:.2f}s "
+          "(vcs-git builds every time)")
+    print("ok" if not failures else f"{len(failures)} failures")
+    return 1 if failures else 0
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        sys.exit(check())
+    if args == ["list"]:
+        sys.exit(list_entries())
+    print(__doc__.strip().splitlines()[1], file=sys.stderr)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+update_check: pending pacman + AUR updates for the waybar updates module
+Usage: update_check.py          print cached state, refresh it in the background when stale
+       update_check.py force    check now and print the result
+       update_check.py watch    print a line whenever the state changes, until killed
+
+The repo check (checkupdates) and the AUR check (paru -Qua) run concurrently,
+so a check takes as long as the slower of the two. Results go to the
+pending list shared with update.py.
+
+watch is waybar's continuous mode. It follows the pending list, the local
+package DB and the sync DBs through inotify. An install or removal prunes
+the list against the local DB, a sync re-reads repo updates with pacman -Qu,
+and only a list older than SYNC_MAX_AGE goes to the network again. When
+update.py publishes the list after an upgrade it shows up right away.
+"""
+import os
+import sys
+import time
+import json
+import fcntl
+import signal
+import select
+import struct
+import ctypes
+import asyncio
+import subprocess
+from collections import namedtuple
+from pathlib import Path
+
+CACHE_DIR = Path.home() / ".cache/updates"
+LOCK_FILE = Path("/tmp/waybar-updates.lock")
+LOCK_TIMEOUT = 10  # seconds a forced check waits for a running one
+REPO_TIMEOUT = 60
+AUR_TIMEOUT = 90
+WAYBAR_SIGNAL = 8  # "signal" of custom/updates in waybar/config.jsonc
+
+# Pending updates shared with update.py: a "# checked <epoch>" header,
+# then one "name<TAB>old<TAB>new<TAB>repo|aur" line per package
+PENDING_FILE = CACHE_DIR / "pending.tsv"
+PACMAN_DB = Path(os.environ.get("UPDATE_PACMAN_DB", "/var/lib/pacman"))
+SYNC_MAX_AGE = 1800  # seconds before the sync DBs or the pending list are stale
+PARU = os.environ.get("UPDATE_PARU", "paru")  # point at a stub to test without paru
+PACMAN = os.environ.get("UPDATE_PACMAN", "pacman")
+CHECKUPDATES = os.environ.get("UPDATE_CHECKUPDATES", "checkupdates")
+
+LOADING = {"text": "0", "class": "checking", "tooltip": "Checking for updates..."}
+
+Package = namedtuple("Package", "name old new source")
+
+# -----------------------------
+# Pending package cache
+# -----------------------------
+def db_mtimes():
+    """Oldest sync DB mtime and the local DB mtime (0 when missing)"""
+    sync = [db.stat().st_mtime for db in (PACMAN_DB / "sync").glob("*.db")]
+    try:
+        local = (PACMAN_DB / "local").stat().st_mtime
+    except OSError:
+        local = 0
+    return min(sync, default=0), local
+
+def read_pending():
+    """(checked at, [Package]) from PENDING_FILE, or None"""
+    try:
+        lines = PENDING_FILE.read_text().splitlines()
+        checked = float(lines[0].split()[-1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return checked, [Package(*line.split("\t")) for line in lines[1:] if line.count("\t") == 3]
+
+def write_pending(packages):
+    PENDING_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = PENDING_FILE.with_suffix(f".{os.getpid()}")
+    tmp.write_text(f"# checked {int(time.time())}\n"
+                   + "".join("\t".join(package) + "\n" for package in packages))
+    tmp.replace(PENDING_FILE)
+
+def pending_is_fresh(checked):
+    # Anything installed or removed since the check makes the list stale
+    _, local = db_mtimes()
+    return time.time() - checked < SYNC_MAX_AGE and checked >= local
+
+def parse_updates(output, source):
+    """Package records from "name old -> new" lines; anything else is skipped"""
+    packages = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 4 and fields[2] == "->":
+            packages.append(Package(fields[0], fields[1], fields[3], source))
+    return packages
+
+# -----------------------------
+# Checking
+# -----------------------------
+def processes():
+    """comm of every running process"""
+    names = set()
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit():
+            try:
+                with open(f"/proc/{entry.name}/comm") as f:
+                    names.add(f.read().strip())
+            except OSError:
+                pass
+    return names
+
+def is_busy():
+    """A package manager holds the DB, so paru -Qua would only get in its way"""
+    return (PACMAN_DB / "db.lck").exists() or bool(processes() & {"pacman", "paru", "yay"})
+
+async def run(argv, timeout):
+    """stdout of argv, or "" when it is missing, fails to start or times out"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    except OSError:
+        return ""
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return ""
+    return out.decode(errors="replace")
+
+async def check(force=False):
+    """Repo and AUR updates, checked concurrently"""
+    async def aur():
+        # For force calls, we always check AUR even if busy
+        if not force and is_busy():
+            return ""
+        return await run([PARU, "-Qua"], AUR_TIMEOUT)
+    repo_out, aur_out = await asyncio.gather(run([CHECKUPDATES], REPO_TIMEOUT), aur())
+    return parse_updates(repo_out, "repo") + parse_updates(aur_out, "aur")
+
+def lock(timeout=0):
+    """Hold LOCK_FILE while checking; None if another check holds it past timeout"""
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if not timeout:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        # A blocking flock that SIGALRM interrupts, instead of polling
+        def expired(signum, frame):
+            raise TimeoutError
+        previous = signal.signal(signal.SIGALRM, expired)
+        signal.alarm(timeout)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+        return fd
+    except (BlockingIOError, TimeoutError):
+        os.close(fd)
+        return None
+
+# -----------------------------
+# Waybar output
+# -----------------------------
+def waybar_json(packages):
+    pacman = sum(1 for p in packages if p.source == "repo")
+    aur = len(packages) - pacman
+    if not packages:
+        return {"text": "0", "class": "no-updates", "tooltip": "System is up to date"}
+    if pacman and aur:
+        tooltip = f"{pacman} pacman + {aur} AUR update(s)"
+    elif pacman:
+        tooltip = f"{pacman} pacman update(s)"
+    else:
+        tooltip = f"{aur} AUR update(s)"
+    return {"text": str(len(packages)), "class": "updates-available", "tooltip": tooltip}
+
+def refresh_waybar():
+    """Make waybar re-run us now that a background check is done"""
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/comm") as f:
+                if f.read().strip() == "waybar":
+                    os.kill(int(entry.name), signal.SIGRTMIN + WAYBAR_SIGNAL)
+        except OSError:
+            pass
+
+def background_check(fd):
+    """Check in a detached child that keeps the lock, then poke waybar"""
+    if os.fork():
+        os.close(fd)
+        return
+    status = 1
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for std in (0, 1, 2):
+            os.dup2(devnull, std)  # waybar waits for our stdout to close
+        write_pending(asyncio.run(check()))
+        refresh_waybar()
+        status = 0
+    finally:
+        os._exit(status)
+
+# -----------------------------
+# Continuous mode
+# -----------------------------
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+SETTLE = 1.0  # seconds without events before acting on a burst of them
+
+class Inotify:
+    """The few inotify calls watch() needs, through libc"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(path))
+        self.watches[wd] = Path(path)
+
+    def read(self, timeout=None):
+        """[(watched directory, file name)] that changed, [] after timeout seconds"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        events, offset = [], 0
+        while offset < len(data):
+            wd, _, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            events.append((self.watches.get(wd), os.fsdecode(name)))
+            offset += 16 + length
+        return events
+
+def prune(packages):
+    """packages still installed at their old version; the rest were upgraded or removed"""
+    installed = set(os.listdir(PACMAN_DB / "local"))
+    return [p for p in packages if f"{p.name}-{p.old}" in installed]
+
+def repo_updates():
+    """Repo updates from the sync DBs as they are, without syncing them"""
+    try:
+        out = subprocess.run([PACMAN, "-Qu"], capture_output=True, text=True, timeout=REPO_TIMEOUT).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    # -Qu also lists ignored packages, marked "[ignored]"
+    return parse_updates("\n".join(line for line in out.splitlines() if "[ignored]" not in line), "repo")
+
+def watch():
+    """Print waybar JSON whenever the pending list changes, until killed"""
+    inotify = Inotify()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    inotify.watch(CACHE_DIR, IN_MOVED_TO | IN_CLOSE_WRITE)
+    inotify.watch(PACMAN_DB, IN_DELETE)  # db.lck going away
+    inotify.watch(PACMAN_DB / "local", IN_CREATE | IN_DELETE | IN_MOVED_TO)
+    inotify.watch(PACMAN_DB / "sync", IN_CLOSE_WRITE | IN_MOVED_TO)
+    shown = None
+
+    def show(state):
+        nonlocal shown
+        line = json.dumps(state)
+        if line != shown:
+            print(line, flush=True)
+            shown = line
+
+    def publish(packages):
+        fd = lock(LOCK_TIMEOUT)
+        if fd is None:
+            return  # another check is about to write the list
+        try:
+            write_pending(packages)
+        finally:
+            os.close(fd)
+        show(waybar_json(packages))
+
+    cached = read_pending()
+    show(waybar_json(cached[1]) if cached else LOADING)
+    changed = set()  # "local" and/or "sync"
+    while True:
+        timeout = None
+        if (PACMAN_DB / "db.lck").exists():
+            timeout = 60  # act once the transaction is over; poll in case we miss its end
+        else:
+            cached = read_pending()
+            if changed and cached:
+                _, local = db_mtimes()
+                if "sync" in changed:
+                    repo = repo_updates()
+                    if repo is not None:
+                        publish(repo + prune([p for p in cached[1] if p.source == "aur"]))
+                elif cached[0] < local:  # nobody (update.py) published since the change
+                    publish(prune(cached[1]))
+                changed.clear()
+                continue
+            changed.clear()
+            age = time.time() - cached[0] if cached else SYNC_MAX_AGE
+            if age >= SYNC_MAX_AGE:
+                fd = lock(LOCK_TIMEOUT)
+                if fd is not None:
+                    try:
+                        packages = asyncio.run(check())
+                        write_pending(packages)
+                    finally:
+                        os.close(fd)
+                    show(waybar_json(packages))
+                    continue
+                age = 0  # a forced check is running and will write the list
+            timeout = max(SYNC_MAX_AGE - age, 1)
+
+        events = inotify.read(timeout)
+        while events:
+            for directory, name in events:
+                if directory == CACHE_DIR and name == PENDING_FILE.name:
+                    cached = read_pending()
+                    if cached:
+                        show(waybar_json(cached[1]))
+                elif directory == PACMAN_DB / "local":
+                    changed.add("local")
+                elif directory == PACMAN_DB / "sync" and name.endswith(".db"):
+                    changed.add("sync")
+            # pacman touches local once per package: wait for the burst to end
+            events = inotify.read(SETTLE) if changed else []
+
+def main():
+    args = sys.argv[1:]
+    if args == ["watch"]:
+        try:
+            watch()
+        except (KeyboardInterrupt, BrokenPipeError):
+            pass  # waybar went away
+        return
+    if args not in ([], ["force"]):
+        print(__doc__.strip().splitlines()[1], file=sys.stderr)
+        sys.exit(1)
+    cached = read_pending()
+
+    if args == ["force"]:
+        fd = lock(LOCK_TIMEOUT)
+        if fd is None:
+            print(json.dumps(waybar_json(cached[1]) if cached else LOADING))
+            return
+        try:
+            packages = asyncio.run(check(force=True))
+            write_pending(packages)
+        finally:
+            os.close(fd)
+        print(json.dumps(waybar_json(packages)))
+        return
+
+    if cached and pending_is_fresh(cached[0]):
+        print(json.dumps(waybar_json(cached[1])))
+        return
+    # Stale: show what we have while a detached check refreshes it,
+    # unless one is already running or a package manager is busy
+    if not is_busy():
+        fd = lock()
+        if fd is not None:
+            background_check(fd)
+    print(json.dumps(waybar_json(cached[1]) if cached else LOADING))
+
+if __name__ == "__main__":
+    main()
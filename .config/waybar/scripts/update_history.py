@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+update_history: a record of every update.py run
+Usage: update_history.py history [runs]
+       update_history.py stats
+       update_history.py check
+
+Each run is one row in a SQLite database, with one row per package:
+versions, download and installed bytes, and the seconds it spent
+downloading, building and installing as ProgressParser saw them. history
+lists the last runs, stats the slowest packages and how runs trend per
+month. check records a synthetic run into a scratch database and times it.
+"""
+import os
+import sys
+import time
+import sqlite3
+from pathlib import Path
+
+HISTORY_DB = Path(os.environ.get("UPDATE_HISTORY", Path.home() / ".local/state/updates/history.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,      -- epoch seconds
+    seconds REAL NOT NULL,      -- from confirmation to paru/pacman exit
+    status INTEGER NOT NULL,
+    mode TEXT NOT NULL,         -- "paru" or "pipeline"
+    download_bytes INTEGER NOT NULL,
+    install_bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    old TEXT NOT NULL,
+    new TEXT NOT NULL,
+    source TEXT NOT NULL,       -- "repo" or "aur"
+    download_bytes INTEGER,     -- NULL when unknown (AUR)
+    install_bytes INTEGER,
+    download REAL,              -- seconds, NULL when the phase was not seen
+    build REAL,
+    install REAL,
+    completed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS packages_name ON packages(name);
+"""
+
+def connect(path=None):
+    path = Path(path or HISTORY_DB)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+def record(started, seconds, status, mode, packages, parser, sizes, build_seconds=None, path=None):
+    """
+    Store one run: packages ([Package]) as parser (a closed ProgressParser)
+    tracked them, with sizes from package_sizes and, for the pipeline, the
+    seconds each prebuild took. Called once the update is over, so the
+    update loop itself only pays for ProgressParser's phase timestamps.
+    """
+    build_seconds = build_seconds or {}
+    rows = []
+    for name, old, new, source in packages:
+        spent = parser.durations(name)
+        download, installed = sizes.get(name, (None, None))
+        rows.append((name, old, new, source, download, installed,
+                     spent.get("download"), build_seconds.get(name, spent.get("build")),
+                     spent.get("install"), parser.phases.get(name) == "done"))
+    db = connect(path)
+    try:
+        with db:
+            run = db.execute(
+                "INSERT INTO runs (started, seconds, status, mode, download_bytes, install_bytes)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (started, seconds, status, mode, sum(r[4] or 0 for r in rows),
+                 sum(r[5] or 0 for r in rows))).lastrowid
+            db.executemany("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(run, *row) for row in rows])
+    finally:
+        db.close()
+    return run
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds) // 60}:{int(seconds) % 60:02d}"
+
+def history(limit=20, path=None):
+    """Print the last limit runs, newest first"""
+    from update_progress import format_size
+    db = connect(path)
+    try:
+        runs = db.execute(
+            "SELECT started, seconds, status, mode, download_bytes,"
+            " (SELECT count(*) FROM packages WHERE run = runs.id),"
+            " (SELECT count(*) FROM packages WHERE run = runs.id AND source = 'aur')"
+            " FROM runs ORDER BY started DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        db.close()
+    if not runs:
+        print(f"No updates recorded in {HISTORY_DB}")
+        return 1
+    print(f"{'started':<18}{'mode':<10}{'status':<8}{'packages':>9}{'aur':>5}{'download':>12}{'took':>9}")
+    for started, seconds, status, mode, download, count, aur in runs:
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(started)):<18}{mode:<10}"
+              f"{'ok' if status == 0 else f'exit {status}':<8}{count:>9}{aur:>5}"
+              f"{format_size(download):>12}{format_seconds(seconds):>9}")
+    return 0
+
+def stats(limit=15, path=None):
+    """Print the slowest packages on average and the monthly trend of runs"""
+    db = connect(path)
+    try:
+        slowest = db.execute(
+            "SELECT name, source, count(*), avg(coalesce(download, 0) + coalesce(build, 0)"
+            " + coalesce(install, 0)) AS spent, avg(download), avg(build), avg(install)"
+            " FROM packages GROUP BY name ORDER BY spent DESC LIMIT ?", (limit,)).fetchall()
+        months = db.execute(
+            "SELECT strftime('%Y-%m', started, 'unixepoch', 'localtime') AS month, count(*),"
+            " sum(status != 0), avg(seconds), avg((SELECT count(*) FROM packages WHERE run = runs.id))"
+            " FROM runs GROUP BY month ORDER BY month").fetchall()
+    finally:
+        db.close()
+    if not months:
+        print(f"No updates recorded in {HISTORY_DB}")
+        return 1
+    print(f"{'slowest packages':<32}{'source':<8}{'runs':>5}{'avg':>9}{'download':>10}{'build':>9}{'install':>9}")
+    for name, source, runs, spent, download, build, install in slowest:
+        print(f"{name:<32}{source:<8}{runs:>5}{format_seconds(spent):>9}{format_seconds(download):>10}"
+              f"{format_seconds(build):>9}{format_seconds(install):>9}")
+    print(f"\n{'month':<10}{'runs':>5}{'failed':>8}{'avg took':>10}{'avg packages':>14}")
+    for month, runs, failed, seconds, count in months:
+        print(f"{month:<10}{runs:>5}{failed:>8}{format_seconds(seconds):>10}{count:>14.1f}")
+    return 0
+
+# -----------------------------
+# Check
+# -----------------------------
+def check():
+    """Record a synthetic run into a scratch database and read it back"""
+    import tempfile
+    from update_check import Package
+    from update_progress import ProgressParser, FIXTURE, FIXTURE_SIZES
+    packages = [Package("linux", "6.9.0-1", "6.9.1-1", "repo"), Package("mesa", "1:24.0-1", "1:24.1-1", "repo"),
+                Package("foo-git", "r1-1", "r2-1", "aur")]
+    parser = ProgressParser([p.name for p in packages], FIXTURE_SIZES)
+    for line, _ in FIXTURE:
+        parser.feed(line)
+    parser.close()
+    many = [Package(f"package-{i}", "1-1", "1-2", "repo") for i in range(2000)]
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+        record(time.time(), 42.0, 0, "paru", packages, parser, FIXTURE_SIZES, path=path)
+        start = time.perf_counter()
+        record(time.time(), 600.0, 1, "pipeline", many, ProgressParser([p.name for p in many]), {},
+               path=path)
+        took = time.perf_counter() - start
+        db = sqlite3.connect(path)
+        rows = {name: (download, build, install, completed) for name, download, build, install, completed in
+                db.execute("SELECT name, download, build, install, completed FROM packages WHERE run = 1")}
+        counted = db.execute("SELECT count(*) FROM packages").fetchone()[0]
+        db.close()
+        for bad, text in (
+            (counted != 2003, f"{counted}/2003 package rows"),
+            (any(not done for *_, done in rows.values()), "a finished package was not marked completed"),
+            (rows["linux"][0] is None or rows["linux"][2] is None, "linux is missing its download/install time"),
+            (rows["foo-git"][1] is None, "foo-git is missing its build time"),
+        ):
+            if bad:
+                failures += 1
+                print(f"FAILED: {text}")
+        history(path=path)
+        print()
+        stats(5, path=path)
+    print(f"\nrecording 2000 packages took {took * 1000:.1f}ms")
+    print("ok" if not failures else f"{failures} failures")
+    return 1 if failures else 0
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        sys.exit(check())
+    if args == ["stats"]:
+        sys.exit(stats())
+    if 1 <= len(args) <= 2 and args[0] == "history":
+        sys.exit(history(*[int(a) for a in args[1:]]))
+    print(__doc__.strip().splitlines()[1], file=sys.stderr)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+update_pipeline: download and build first, then install, for update.py
+Usage: update_pipeline.py check
+
+Instead of one paru -Syu that downloads, builds and installs in turn, repo
+packages are downloaded (pacman -Syuw) while AUR packages are fetched and
+built in a bounded worker pool. The install transactions only start once
+every artifact is ready, which keeps the half-upgraded window short.
+check runs the pipeline against stub pacman/paru/makepkg executables and
+verifies that ordering.
+"""
+import os
+import sys
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from update_check import PACMAN, PARU, Package
+from update_progress import ChildOutput
+from update_cache import ArtifactCache, packagelist
+
+CACHE_DIR = Path.home() / ".cache/updates"
+BUILD_DIR = CACHE_DIR / "aur"
+AUR_WORKERS = int(os.environ.get("UPDATE_AUR_WORKERS", "2"))
+MAKEPKG = os.environ.get("UPDATE_MAKEPKG", "makepkg")
+SUDO = os.environ.get("UPDATE_SUDO", "sudo").split()  # empty to run pacman directly
+E_ALREADY_BUILT = 13  # makepkg's exit status when the package file exists
+
+def fetch(name, build_dir, run):
+    """Clone or update name's AUR repo as build_dir/name with run(*argv, cwd=...)"""
+    if (build_dir / name / ".git").exists():
+        return run("git", "pull", "--ff-only", cwd=build_dir / name)
+    return run(PARU, "-G", name, cwd=build_dir)
+
+def cached_builds(names, cache=None, build_dir=BUILD_DIR):
+    """{name: package files} for the AUR packages the artifact cache already has"""
+    cache = cache or ArtifactCache()
+    build_dir = Path(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    def run(*argv, cwd):
+        return subprocess.run(argv, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode
+    hits = {}
+    for name in names:
+        key = cache.key(build_dir / name) if fetch(name, build_dir, run) == 0 else None
+        files = key and cache.fetch(key, build_dir / name)
+        if files:
+            hits[name] = files
+    return hits
+
+class Pipeline:
+    """
+    Runs one upgrade of packages ([Package]) as download + build, then
+    install. Output of the pacman transactions goes to log and through
+    parser; on_progress(parser) is called whenever the parser moved and
+    report(text) for build and stage messages.
+    """
+
+    def __init__(self, packages, parser, log, on_progress, report,
+                 build_dir=BUILD_DIR, workers=AUR_WORKERS, use_pty=True, cache=None):
+        self.repo = [p.name for p in packages if p.source == "repo"]
+        self.aur = [p.name for p in packages if p.source == "aur"]
+        self.parser = parser
+        self.log = log
+        self.on_progress = on_progress
+        self.report = report
+        self.build_dir = Path(build_dir)
+        self.workers = workers
+        self.use_pty = use_pty
+        self.build_seconds = {}  # name -> seconds its prebuild took
+        self.cache = cache if cache is not None else ArtifactCache()
+
+    def stream(self, argv):
+        output = ChildOutput(argv, self.use_pty)
+        for piece in output:
+            self.log.write(piece)
+            if self.parser.feed(piece):
+                self.on_progress(self.parser)
+        return output.returncode
+
+    def build(self, name):
+        """
+        Fetch or update name's PKGBUILD and build it, unless the artifact
+        cache has it; (name, package files or None, seconds, from the cache)
+        """
+        start = time.monotonic()
+        workdir = self.build_dir / name
+        with open(self.build_dir / f"{name}.log", "w") as log:
+            def run(*argv, cwd=workdir):
+                return subprocess.run(argv, cwd=cwd, stdin=subprocess.DEVNULL,
+                                      stdout=log, stderr=subprocess.STDOUT).returncode
+            fetched = fetch(name, self.build_dir, run)
+            key = self.cache.key(workdir) if fetched == 0 else None
+            files = key and self.cache.fetch(key, workdir)
+            if files:
+                return name, files, time.monotonic() - start, True
+            # No --syncdeps: pacman is busy downloading. A build that needs
+            # new dependencies falls back to paru after the install.
+            built = fetched == 0 and run(MAKEPKG, "--noconfirm") in (0, E_ALREADY_BUILT)
+        files = packagelist(workdir, MAKEPKG) if built else None
+        if files and key:
+            self.cache.store(key, files)
+        return name, files, time.monotonic() - start, False
+
+    def run(self):
+        """Exit status of the first failing stage, or 0"""
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        artifacts, fallback = [], []
+        with ThreadPoolExecutor(max(1, self.workers)) as pool:
+            builds = [pool.submit(self.build, name) for name in self.aur]
+            if self.repo:
+                status = self.stream([*SUDO, PACMAN, "-Syuw", "--noconfirm"])
+                if status:
+                    pool.shutdown(cancel_futures=True)
+                    return status
+                self.report("repo packages downloaded")
+            for future in as_completed(builds):
+                name, files, seconds, cached = future.result()
+                if files:
+                    artifacts += files
+                    self.parser.set_phase(name, "downloaded")
+                    if cached:
+                        self.report(f"reusing {name} from {self.cache.root}")
+                    else:
+                        self.build_seconds[name] = seconds
+                        self.report(f"built {name} in {seconds:.0f}s")
+                else:
+                    fallback.append(name)
+                    self.report(f"could not prebuild {name}, leaving it to paru "
+                                f"(see {self.build_dir / name}.log)")
+                self.on_progress(self.parser)
+
+        if self.repo:
+            status = self.stream([*SUDO, PACMAN, "-Su", "--noconfirm"])
+            if status:
+                return status
+        if artifacts:
+            status = self.stream([*SUDO, PACMAN, "-U", "--noconfirm", *artifacts])
+            if status:
+                return status
+        if fallback:
+            return self.stream([PARU, "-S", "--noconfirm", *fallback])
+        return 0
+
+# -----------------------------
+# Check against stub executables
+# -----------------------------
+STUB = """#!/bin/sh
+echo "$(date +%s.%N) {name} $*" >> "{events}"
+"""
+STUB_PACMAN = STUB + """
+case "$1" in
+  -Syuw) sleep 0.3; echo " base-1-1-x86_64 downloading..." ;;
+  -Su) echo "(1/1) upgrading base" ;;
+  -U) shift 2; for f in "$@"; do echo "(1/1) upgrading $(basename "$f" -1-1-x86_64.pkg.tar.zst)"; done ;;
+esac
+echo "$(date +%s.%N) {name} done $1" >> "{events}"
+"""
+STUB_PARU = STUB + """
+[ "$1" = -G ] && mkdir -p "$2" && echo "pkgname=$2" > "$2/PKGBUILD"
+[ "$1" = -S ] && echo "(1/1) upgrading $3"
+exit 0
+"""
+STUB_MAKEPKG = STUB + """
+name=$(basename "$PWD")
+if [ "$1" = --packagelist ]; then echo "$PWD/$name-1-1-x86_64.pkg.tar.zst"; exit 0; fi
+echo "$(date +%s.%N) {name} start $name" >> "{events}"
+sleep 0.3
+if [ "$name" = broken-git ]; then echo "$(date +%s.%N) {name} failed $name" >> "{events}"; exit 4; fi
+touch "$name-1-1-x86_64.pkg.tar.zst"
+echo "$(date +%s.%N) {name} built $name" >> "{events}"
+"""
+
+def check():
+    import tempfile
+    from update_progress import ProgressParser
+    global PACMAN, PARU, MAKEPKG, SUDO
+    with tempfile.TemporaryDirectory() as tmp:
+        events = os.path.join(tmp, "events")
+        for name, script in (("pacman", STUB_PACMAN), ("paru", STUB_PARU), ("makepkg", STUB_MAKEPKG)):
+            path = os.path.join(tmp, name)
+            with open(path, "w") as f:
+                f.write(script.format(name=name, events=events))
+            os.chmod(path, 0o755)
+        PACMAN, PARU, MAKEPKG, SUDO = (os.path.join(tmp, "pacman"), os.path.join(tmp, "paru"),
+                                       os.path.join(tmp, "makepkg"), [])
+        packages = [Package("base", "1-0", "1-1", "repo")] + [
+            Package(name, "1-0", "1-1", "aur") for name in ("a-git", "b-git", "c-git", "broken-git")]
+        parser = ProgressParser([p.name for p in packages])
+        messages = []
+        with open(os.path.join(tmp, "log"), "w") as log:
+            status = Pipeline(packages, parser, log, lambda parser: None, messages.append,
+                              build_dir=os.path.join(tmp, "aur"), workers=2, use_pty=False,
+                              cache=ArtifactCache(os.path.join(tmp, "cache"))).run()
+        parser.close()
+        with open(events) as f:
+            log = [line.split(None, 2) for line in f]
+
+    def when(name, args):
+        return [float(t) for t, n, a in log if n == name and a.strip().startswith(args)]
+    download_end = when("pacman", "done -Syuw")[0]
+    builds = when("makepkg", "start")
+    built = when("makepkg", "built")
+    ended = built + when("makepkg", "failed")
+    installs = when("pacman", "-Su") + when("pacman", "-U")
+    running, most = 0, 0
+    for _, change in sorted([(t, 1) for t in builds] + [(t, -1) for t in ended]):
+        running += change
+        most = max(most, running)
+    problems = [text for bad, text in (
+        (status != 0, f"pipeline exited {status}"),
+        (min(builds) > download_end, "no build overlapped the repo download"),
+        (len(built) != 3, f"{len(built)}/3 builds finished"),
+        (most > 2, f"{most} builds ran at once with 2 workers"),
+        (min(installs) < max(ended + [download_end]), "installing started before every artifact was ready"),
+        (not when("paru", "-S --noconfirm broken-git"), "the failed build did not fall back to paru"),
+        (parser.completed != 5, f"{parser.completed}/5 packages counted as upgraded"),
+    ) if bad]
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    print("\n".join(messages))
+    print("ok" if not problems else f"{len(problems)} failures")
+    return 1 if problems else 0
+
+def main():
+    if sys.argv[1:] != ["check"]:
+        print(__doc__.strip().splitlines()[1], file=sys.stderr)
+        sys.exit(1)
+    sys.exit(check())
+
+if __name__ == "__main__":
+    main()
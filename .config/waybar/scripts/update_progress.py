@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+update_progress: progress tracking for paru -Syu output
+Usage: update_progress.py bench [transcript ...]
+       update_progress.py check
+       update_progress.py latency
+
+bench times the parser against the line-by-line regex loop update.py used to
+run, over recorded paru transcripts (the last update log by default, or a
+synthetic transcript when there is none). check replays a captured
+transcript with known package sizes and verifies the byte-weighted progress.
+latency measures how late carriage-return progress from a fake child
+arrives through a pseudo-terminal and through a line-buffered pipe.
+"""
+import os
+import re
+import sys
+import time
+import statistics
+import subprocess
+import selectors
+import fcntl
+import termios
+from pathlib import Path
+
+UPDATE_LOG = Path.home() / ".cache/updates/last-update.txt"
+LOG_FLUSH_INTERVAL = 1.0  # seconds between log flushes while paru runs
+PACMAN = os.environ.get("UPDATE_PACMAN", "pacman")
+EXPAC = os.environ.get("UPDATE_EXPAC", "expac")
+
+# Every line worth classifying, in one pass:
+#   (3/12) upgrading mesa    [####---] 45%     step of a transaction or hook run
+#    mesa-24.1-1-x86_64 downloading...          download without a terminal
+#    mesa-24.1-1-x86_64  9.1 MiB ... [###] 45%   download on a terminal
+#   :: Running post-transaction hooks...
+#   ==> Making package: foo-git r2-1 (...)   AUR build started / finished
+LINE = re.compile(
+    r"\s*\(\d+/\d+\) (?P<step>[^\[\r\n]*)(?:\[[^\]]*\]\s*(?P<step_percent>\d+)%)?"
+    r"|\s*(?P<download>\S+) (?:downloading\.\.\.|.*?(?P<percent>\d+)%\s*$)"
+    r"|:: Running (?P<hooks>pre|post)-transaction hooks"
+    r"|==> (?P<build>Making|Finished making) package: (?P<built>\S+)"
+)
+
+# (i/n) steps that move a package into a phase; "checking ..." steps verify
+# the whole transaction at once
+INSTALL_STEPS = {"installing", "upgrading", "reinstalling", "downgrading"}
+VERIFY_STEPS = {"checking keys in keyring", "checking package integrity", "loading package files",
+                "checking for file conflicts", "checking available disk space"}
+
+DOWNLOADED = {"downloaded", "verify", "install", "done"}
+
+def parse_size(text):
+    """Bytes from pacman's "130.57 MiB" style sizes"""
+    number, _, unit = text.strip().partition(" ")
+    scale = {"B": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30, "TiB": 1 << 40}
+    return int(float(number) * scale.get(unit, 1))
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def package_sizes(names):
+    """
+    {name: (download bytes, installed bytes)} for repo packages, from one
+    batched expac query, or one pacman -Si when expac is not installed.
+    AUR packages are simply missing from the result.
+    """
+    if not names:
+        return {}
+    try:
+        out = subprocess.run([EXPAC, "-S", "%n\t%k\t%m", *names],
+                             capture_output=True, text=True).stdout
+        return {name: (int(download), int(installed))
+                for name, download, installed in
+                (line.split("\t") for line in out.splitlines() if line.count("\t") == 2)}
+    except (OSError, ValueError):
+        pass
+    try:
+        out = subprocess.run([PACMAN, "-Si", *names], capture_output=True, text=True).stdout
+    except OSError:
+        return {}
+    sizes, fields = {}, {}
+    for line in out.splitlines() + [""]:
+        key, sep, value = line.partition(" : ")
+        if sep:
+            fields[key.strip()] = value.strip()
+        elif fields:
+            try:
+                sizes.setdefault(fields["Name"], (parse_size(fields["Download Size"]),
+                                                  parse_size(fields["Installed Size"])))
+            except (KeyError, ValueError):
+                pass
+            fields = {}
+    return sizes
+
+class ProgressParser:
+    """
+    Classifies paru output lines with one regex match each and tracks the
+    phase of every package being upgraded: download, build (AUR), verify,
+    install, then done once the transaction moves past it.
+
+    With sizes ({name: (download bytes, installed bytes)}) progress is
+    weighted by bytes: downloads by archive size, installs by installed
+    size. Packages without sizes (AUR) download nothing through pacman and
+    weigh as much as the median installed package.
+    """
+
+    def __init__(self, packages, sizes=None):
+        sizes = sizes or {}
+        if sizes:
+            typical = (0, statistics.median(installed for _, installed in sizes.values()))
+        else:
+            typical = (1, 1)  # no sizes at all: count packages instead
+        self.phases = {name: "pending" for name in packages}
+        self.sizes = {name: sizes.get(name, typical) for name in packages}
+        self.percent = {}       # name -> % through its download or install
+        self.credited = {}      # name -> (download bytes, installed bytes) counted so far
+        self.download_total = sum(download for download, _ in self.sizes.values())
+        self.install_total = sum(installed for _, installed in self.sizes.values())
+        self.downloaded = 0
+        self.installed = 0
+        self.started = {}       # "download"/"install" -> when bytes first moved
+        self.stage = "pending"  # phase of the transaction as a whole
+        self.installing = None  # package pacman is unpacking right now
+        self.fetching = None    # download reported without a percentage
+        self.completed = 0
+        self.entered = {}       # name -> [(phase, when)], one entry per phase change
+
+    @property
+    def total(self):
+        return len(self.phases)
+
+    def account(self, name):
+        """Move the byte counters by what changed for one package"""
+        phase = self.phases[name]
+        download, installed = self.sizes[name]
+        fraction = self.percent.get(name, 0) / 100
+        now = (download if phase in DOWNLOADED else download * fraction if phase == "download" else 0,
+               installed if phase == "done" else installed * fraction if phase == "install" else 0)
+        before = self.credited.get(name, (0, 0))
+        self.credited[name] = now
+        self.downloaded += now[0] - before[0]
+        self.installed += now[1] - before[1]
+        if now[0] > before[0] and "download" not in self.started:
+            self.started["download"] = time.monotonic()
+        if now[1] > before[1] and "install" not in self.started:
+            self.started["install"] = time.monotonic()
+
+    def enter(self, name, phase):
+        self.entered.setdefault(name, []).append((phase, time.monotonic()))
+
+    def durations(self, name):
+        """{phase: seconds} name spent in each phase it has left"""
+        spent = {}
+        changes = self.entered.get(name, [])
+        for (phase, start), (_, end) in zip(changes, changes[1:]):
+            spent[phase] = spent.get(phase, 0) + end - start
+        return spent
+
+    def set_phase(self, name, phase, percent=None):
+        if name in self.phases and self.phases[name] != "done":
+            if self.phases[name] != phase:
+                self.percent.pop(name, None)
+                self.enter(name, phase)
+            self.phases[name] = phase
+            if percent is not None:
+                self.percent[name] = percent
+            self.account(name)
+
+    def finish(self, name):
+        if name in self.phases and self.phases[name] != "done":
+            self.phases[name] = "done"
+            self.completed += 1
+            self.enter(name, "done")
+            self.account(name)
+
+    def progress(self):
+        """(phase, bytes done, bytes total, seconds left or None) of the current phase"""
+        if self.stage in ("pending", "download", "verify"):
+            phase, done, total = "download", self.downloaded, self.download_total
+        else:
+            phase, done, total = "install", self.installed, self.install_total
+        eta = None
+        started = self.started.get(phase)
+        if started and 0 < done < total:
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                eta = (total - done) / (done / elapsed)
+        return phase, done, total, eta
+
+    def feed(self, line):
+        """Update state from one output line; True when progress moved"""
+        match = LINE.match(line)
+        if not match:
+            return False
+        step = match["step"]
+        if step:
+            # A progress bar, when pacman draws one, starts at the "["
+            step = step.strip()
+            verb, _, package = step.partition(" ")
+            percent = int(match["step_percent"]) if match["step_percent"] else None
+            if verb in INSTALL_STEPS:
+                # Unpacking a package means the one before it is in place
+                if self.installing and self.installing != package:
+                    self.finish(self.installing)
+                self.installing = package
+                self.stage = "install"
+                self.set_phase(package, "install", percent)
+            elif step in VERIFY_STEPS and self.stage != "verify":
+                self.stage = "verify"
+                for name, phase in self.phases.items():
+                    if phase in ("pending", "download", "downloaded"):
+                        self.set_phase(name, "verify")
+            else:
+                return False
+            return True
+        if match["download"]:
+            # Archives are named <pkgname>-<pkgver>-<pkgrel>-<arch>
+            name = match["download"].rsplit("-", 3)[0]
+            if name not in self.phases:
+                return False  # a sync DB or the "Total" line
+            self.stage = "download"
+            if match["percent"]:
+                self.set_phase(name, "download", int(match["percent"]))
+                return True
+            # Without a terminal pacman only says when each download starts,
+            # so take the one before as finished
+            if self.fetching and self.fetching != name:
+                self.set_phase(self.fetching, "downloaded")
+            self.fetching = name
+            self.set_phase(name, "download")
+            return True
+        if match["hooks"]:
+            if self.installing:
+                self.finish(self.installing)
+                self.installing = None
+            self.stage = "hooks"
+            return True
+        if match["build"] == "Making":
+            self.stage = "build"
+            self.set_phase(match["built"], "build")
+            return True
+        if match["build"]:
+            self.set_phase(match["built"], "verify")
+            return True
+        return False
+
+    def close(self):
+        """paru exited: the last package unpacked is in place too"""
+        if self.installing:
+            self.finish(self.installing)
+            self.installing = None
+        self.stage = "done"
+
+class BufferedLog:
+    """Write-behind log of paru output, flushed at most every LOG_FLUSH_INTERVAL"""
+
+    def __init__(self, path):
+        self.file = open(path, "w", buffering=64 * 1024)
+        self.flushed = time.monotonic()
+        self.flushes = 0
+
+    def write(self, text):
+        self.file.write(text)
+        now = time.monotonic()
+        if now - self.flushed >= LOG_FLUSH_INTERVAL:
+            self.file.flush()
+            self.flushed = now
+            self.flushes += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# -----------------------------
+# Reading paru's output
+# -----------------------------
+# Pieces of output ending in \r, \n or \r\n; escape sequences are dropped
+PIECE = re.compile(rb"[^\r\n]*(?:\r\n|\r|\n)")
+ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+class ChildOutput:
+    """
+    Runs argv and iterates over its output in pieces as they arrive, each
+    ending in \r or \n. With use_pty the child writes to a pseudo-terminal,
+    so pacman draws its per-package progress (\r-terminated updates) and
+    does not block-buffer; stdin stays on our terminal for sudo's prompt.
+    returncode is set once iteration is over.
+    """
+
+    def __init__(self, argv, use_pty=True):
+        self.argv = argv
+        self.use_pty = use_pty
+        self.proc = None
+
+    @property
+    def returncode(self):
+        return self.proc.returncode if self.proc else None
+
+    def __iter__(self):
+        if not self.use_pty:
+            proc = subprocess.Popen(self.argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    universal_newlines=True, bufsize=1)
+            self.proc = proc
+            yield from proc.stdout
+            proc.wait()
+            return
+
+        master, slave = os.openpty()
+        try:
+            # Same width as ours, so pacman's bars fit the window
+            fcntl.ioctl(slave, termios.TIOCSWINSZ, fcntl.ioctl(sys.stdout, termios.TIOCGWINSZ, bytes(8)))
+        except OSError:
+            pass
+        try:
+            proc = subprocess.Popen(self.argv, stdout=slave, stderr=slave)
+        finally:
+            os.close(slave)
+        self.proc = proc
+        os.set_blocking(master, False)
+        selector = selectors.DefaultSelector()
+        selector.register(master, selectors.EVENT_READ)
+        pending = b""
+        try:
+            while True:
+                # A build can leave a daemon (gpg-agent) holding the terminal,
+                # so stop on the child's exit as well as on EOF
+                ready = selector.select(0.2)
+                if not ready and proc.poll() is not None:
+                    break
+                try:
+                    data = os.read(master, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""  # EIO: every writer closed the terminal
+                if not data:
+                    break
+                pending += data
+                end = 0
+                for match in PIECE.finditer(pending):
+                    yield ESCAPE.sub("", match.group().decode(errors="replace"))
+                    end = match.end()
+                pending = pending[end:]
+            if pending:
+                yield ESCAPE.sub("", pending.decode(errors="replace"))
+        finally:
+            selector.close()
+            os.close(master)
+            proc.wait()
+
+# -----------------------------
+# Fixture check
+# -----------------------------
+FIXTURE_SIZES = {"linux": (100 << 20, 140 << 20), "mesa": (30 << 20, 60 << 20)}
+# A captured paru -Syu on a terminal (progress lines end in \r), each line
+# followed by the (phase, bytes done, bytes total) it must produce. foo-git
+# is from the AUR, so it weighs the median installed size: 100 MiB.
+FIXTURE = [
+    (":: Synchronizing package databases...", ("download", 0, 130 << 20)),
+    (" core    130.5 KiB  1201 KiB/s 00:00 [######################] 100%", ("download", 0, 130 << 20)),
+    (":: Retrieving packages...", ("download", 0, 130 << 20)),
+    (" linux-6.9.1-1-x86_64    50.0 MiB  20.1 MiB/s 00:02 [###########-----------]  50%",
+     ("download", 50 << 20, 130 << 20)),
+    (" mesa-1:24.1-1-x86_64    30.0 MiB  20.1 MiB/s 00:00 [######################] 100%",
+     ("download", 80 << 20, 130 << 20)),
+    (" linux-6.9.1-1-x86_64   100.0 MiB  20.1 MiB/s 00:00 [######################] 100%",
+     ("download", 130 << 20, 130 << 20)),
+    (" Total (2/2)   130.0 MiB  20.1 MiB/s 00:06 [######################] 100%",
+     ("download", 130 << 20, 130 << 20)),
+    ("(2/2) checking keys in keyring     [######################] 100%", ("download", 130 << 20, 130 << 20)),
+    (":: Processing package changes...", ("download", 130 << 20, 130 << 20)),
+    ("(1/2) upgrading linux              [#####-----------------]  25%", ("install", 35 << 20, 300 << 20)),
+    ("(1/2) upgrading linux              [######################] 100%", ("install", 140 << 20, 300 << 20)),
+    ("(2/2) upgrading mesa               [######################] 100%", ("install", 200 << 20, 300 << 20)),
+    (":: Running post-transaction hooks...", ("install", 200 << 20, 300 << 20)),
+    ("(1/2) Arming ConditionNeedsUpdate...", ("install", 200 << 20, 300 << 20)),
+    ("==> Making package: foo-git r2-1 (Sat 01 Jun 2024)", ("install", 200 << 20, 300 << 20)),
+    ("==> Finished making: foo-git r2-1 (Sat 01 Jun 2024)", ("install", 200 << 20, 300 << 20)),
+    ("(1/1) upgrading foo-git            [######################] 100%", ("install", 300 << 20, 300 << 20)),
+]
+
+def check():
+    """Replay FIXTURE and compare every step's byte progress"""
+    parser = ProgressParser(["linux", "mesa", "foo-git"], FIXTURE_SIZES)
+    failures = 0
+    for line, expected in FIXTURE:
+        parser.feed(line)
+        phase, done, total, _ = parser.progress()
+        if (phase, int(done), total) != expected:
+            failures += 1
+            print(f"FAILED {line.strip()!r}: got {(phase, int(done), total)}, expected {expected}")
+    parser.close()
+    if parser.completed != 3:
+        failures += 1
+        print(f"FAILED {parser.completed}/3 packages completed")
+    print("ok" if not failures else f"{failures} failures")
+    return 1 if failures else 0
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def synthetic_transcript(packages=2000):
+    names = [f"package-{i}" for i in range(packages)]
+    lines = [":: Synchronizing package databases...", " core is up to date",
+             ":: Starting full system upgrade...", "resolving dependencies...",
+             "looking for conflicting packages...", "",
+             f"Packages ({packages}) " + " ".join(f"{n}-1.0-1" for n in names), "",
+             ":: Proceed with installation? [Y/n] ", ":: Retrieving packages..."]
+    lines += [f" {n}-1.0-1-x86_64 downloading..." for n in names]
+    for step in sorted(VERIFY_STEPS):
+        lines += [f"({i}/{packages}) {step}" for i in range(1, packages + 1)]
+    lines.append(":: Processing package changes...")
+    for i, n in enumerate(names, 1):
+        lines.append(f"({i}/{packages}) upgrading {n}")
+        lines += [f"  {n}: installing new files", "ldconfig: warning"] * 3
+    lines.append(":: Running post-transaction hooks...")
+    lines += [f"({i}/20) Arming ConditionNeedsUpdate..." for i in range(1, 21)]
+    return [line + "\n" for line in lines], names
+
+def transcript_packages(lines):
+    """Package names from the "Packages (n) name-ver-rel ..." line, if any"""
+    for line in lines:
+        if line.startswith("Packages ("):
+            return [spec.rsplit("-", 2)[0] for spec in line.split()[2:]]
+    return []
+
+def legacy_loop(lines, total_packages, logfile):
+    """The loop update.py ran before ProgressParser, kept for comparison"""
+    install_patterns = [
+        re.compile(r"installing (\S+)"),
+        re.compile(r"upgrading (\S+)"),
+        re.compile(r"reinstalling (\S+)"),
+        re.compile(r"\[(\d+)/(\d+)\]"),
+    ]
+    completed_packages = 0
+    for output in lines:
+        logfile.write(output)
+        logfile.flush()
+        line = output.strip().lower()
+        for pattern in install_patterns:
+            if pattern.search(line):
+                match = re.search(r"\[(\d+)/(\d+)\]", line)
+                if match and int(match.group(2)) == total_packages:
+                    completed_packages = int(match.group(1))
+                else:
+                    completed_packages = min(completed_packages + 1, total_packages)
+                break
+        if any(keyword in line for keyword in ['downloading', 'checking', 'resolving']):
+            pass
+    return completed_packages
+
+def parser_loop(lines, packages, path):
+    parser = ProgressParser(packages)
+    with BufferedLog(path) as log:
+        for output in lines:
+            log.write(output)
+            parser.feed(output)
+    parser.close()
+    return parser.completed, log.flushes + 1
+
+def bench(paths, rounds=5):
+    import tempfile
+    transcripts = []
+    for path in paths or ([UPDATE_LOG] if UPDATE_LOG.exists() else []):
+        with open(path, errors="replace") as f:
+            lines = f.readlines()
+        transcripts.append((str(path), lines, transcript_packages(lines)))
+    if not transcripts:
+        lines, names = synthetic_transcript()
+        transcripts.append(("synthetic", lines, names))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "log")
+        for name, lines, packages in transcripts:
+            legacy = parsed = float("inf")
+            for _ in range(rounds):
+                start = time.process_time()
+                with open(log, "w") as f:
+                    legacy_done = legacy_loop(lines, len(packages), f)
+                legacy = min(legacy, time.process_time() - start)
+                start = time.process_time()
+                parsed_done, flushes = parser_loop(lines, packages, log)
+                parsed = min(parsed, time.process_time() - start)
+            print(f"{name}: {len(lines)} lines, {len(packages)} packages")
+            print(f"  legacy loop  {legacy * 1000:8.1f}ms cpu, {len(lines)} log flushes, "
+                  f"{legacy_done}/{len(packages)} counted")
+            print(f"  parser       {parsed * 1000:8.1f}ms cpu, {flushes} log flushes, "
+                  f"{parsed_done}/{len(packages)} counted ({legacy / max(parsed, 1e-9):.1f}x)")
+    return 0
+
+# Writes "<sent at> <i>%\r" updates without a newline, like pacman's bars,
+# and only flushes them on a terminal
+FAKE_PROGRESS = """
+import os, sys, time
+out = open(1, "w", closefd=False)  # block-buffered unless it is a terminal
+for i in range(0, 101, 5):
+    out.write(f"{time.monotonic():.6f} {i}%\\r")
+    if out.isatty():
+        out.flush()
+    time.sleep(0.05)
+out.write("\\n")
+"""
+
+def latency():
+    """How long \r progress from a fake child takes to reach the parser"""
+    for mode, use_pty in (("pty", True), ("pipe", False)):
+        delays = []
+        for piece in ChildOutput([sys.executable, "-c", FAKE_PROGRESS], use_pty):
+            received = time.monotonic()
+            for update in piece.replace("\r", "\n").split("\n"):
+                sent = update.split(" ")[0]
+                if sent:
+                    delays.append(received - float(sent))
+        delays.sort()
+        print(f"{mode:<5} {len(delays)} updates, p50 {delays[len(delays) // 2] * 1000:.1f}ms, "
+              f"max {delays[-1] * 1000:.1f}ms late")
+    return 0
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        sys.exit(check())
+    if args == ["latency"]:
+        sys.exit(latency())
+    if not args or args[0] != "bench":
+        print(__doc__.strip().splitlines()[1], file=sys.stderr)
+        sys.exit(1)
+    sys.exit(bench(args[1:]))
+
+if __name__ == "__main__":
+    main()
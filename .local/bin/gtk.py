@@ -4,28 +4,86 @@ import json
 import argparse
 import sys
 import os
+import io
+import re
+import time
+import hashlib
+import select
+import struct
+import ctypes
+
+WAL_JSON = os.path.expanduser("~/.cache/wal/pywal.json")
 
 
 #############
 # functions #
 #############
 
-def data_sub_link(dictio, key, value):
+# "@name" references to another variable or a palette entry, anywhere
+# in a value: "@accent_bg_color", "alpha(@blue_3, 0.5)"
+LINK = re.compile(r"@([A-Za-z0-9_-]+)")
+
+# resolved variable tables of recent inputs, keyed by their hash
+resolved_cache = {}
+RESOLVED_CACHE_SIZE = 8
+
+
+def resolve_links(variables, palette=None, debug=False):
     """
-    return type: void
+    return type: dict
     description:
-      replace the "@key_name" links
-      with the color string value of
-      the refferenced key
+      variables with every "@name" link replaced by
+      what it finally stands for, following chains
+      (@a -> @b -> #hex) through palette entries too.
+      every variable is resolved exactly once, in
+      dependency order, so deep chains stay linear.
+      a cycle or a link to nothing is a ValueError
+      naming the chain. results are cached by a hash
+      of the input, for the watch mode
     """
-    if value.find("@") > -1:
-        index_str = value[1:]
-        dictio[key] = dictio[index_str]
-        if args.debug:
-            print("{k}: {v}".format(k=key, v=dictio[key]))
+    table = {}
+    for tint, colors in (palette or {}).items():
+        for ind, col in colors.items():
+            table["{}{}".format(tint, ind)] = col
+    table.update(variables)
+    key = hashlib.sha256(json.dumps(table, sort_keys=True).encode()).hexdigest()
+    if key in resolved_cache:
+        return dict(resolved_cache[key])
+
+    resolved = {}
+    for start in variables:
+        if start in resolved:
+            continue
+        # depth first without recursion: a stack of names still being resolved
+        stack, on_stack = [start], {start}
+        while stack:
+            name = stack[-1]
+            pending = [ref for ref in LINK.findall(table[name]) if ref not in resolved]
+            for ref in pending:
+                if ref in on_stack:
+                    chain = stack[stack.index(ref):] + [ref]
+                    raise ValueError("color links form a cycle: {}".format(
+                        " -> ".join("@" + n for n in chain)))
+                if ref not in table:
+                    raise ValueError("{} links to @{}, which is not defined".format(name, ref))
+            if pending:
+                stack.append(pending[0])
+                on_stack.add(pending[0])
+                continue
+            resolved[name] = LINK.sub(lambda m: resolved[m.group(1)], table[name])
+            if debug and resolved[name] != table[name]:
+                print("{k}: {v}".format(k=name, v=resolved[name]))
+            stack.pop()
+            on_stack.discard(name)
 
+    result = {name: resolved[name] for name in variables}
+    if len(resolved_cache) >= RESOLVED_CACHE_SIZE:
+        resolved_cache.pop(next(iter(resolved_cache)))
+    resolved_cache[key] = result
+    return dict(result)
 
-def data_rgb_to_hex(dictio, key, value):
+
+def data_rgb_to_hex(dictio, key, value, debug=False):
     """
     return type: void
     description:
@@ -42,136 +100,586 @@ def data_rgb_to_hex(dictio, key, value):
         b = int(vallist[2])
         res = "#{0:02x}{1:02x}{2:02x}".format(r, g, b)
         dictio[key] = res
-        if args.debug:
+        if debug:
             print("{k}: {v}".format(
                 k=key, v=dictio[key]))
 
 
-########
-# Main #
-########
+################
+# color engine #
+################
 
-# Initialize parser
-parser = argparse.ArgumentParser()
+# sRGB byte -> linear light, looked up instead of computed per channel
+SRGB_TO_LINEAR = [c / 255 / 12.92 if c <= 10 else ((c / 255 + 0.055) / 1.055) ** 2.4
+                  for c in range(256)]
 
-# Adding optional argument
-parser.add_argument("-f", "--file", required="true", help="JSON file to use")
-parser.add_argument("-d", "--debug", action='store_true',
-                    help="Show Debug Output")
-parser.add_argument(
-    "-t",
-    "--target",
-    dest="targ",
-    help="should be the PARENT dir "
-    "containing the 'gtk-3.0' and 'gtk-4.0' dirs "
-    "otherwise the target will default to: "
-    "$XDG_CONFIG_HOME",
-)
 
+def linear_to_srgb(x):
+    x = min(max(x, 0.0), 1.0)
+    if x <= 0.0031308:
+        return round(x * 12.92 * 255)
+    return round((1.055 * x ** (1 / 2.4) - 0.055) * 255)
 
-# Read arguments from command line
-args = parser.parse_args()
 
-if args.debug:
-    print("Displaying Debug Output of % s" % parser.prog)
-    print("File '{}' selected".format(args.file))
+def broadcast(value, n):
+    """a scalar repeated n times, or a list as is"""
+    if isinstance(value, (list, tuple)):
+        return value
+    return [value] * n
 
-with open(args.file) as json_file:
-    data = json.load(json_file)
-    if args.debug:
-        print("Data read from file:", args.file)
-        print("Name:", data["name"])
-        # print("Vars:", data["variables"])
-        for keys, values in data["variables"].items():
-            print("{key: >24}: {value}".format(key=keys, value=values))
-
-# correct data
-# substituting links and removing the rgba part is not needed here
-# for keys, values in data["variables"].items():
-#     data_sub_link(data["variables"], keys, values)
-# for keys, values in data["variables"].items():
-#     data_rgb_to_hex(data["variables"], keys, values)
-if "sidebar_bg_color" not in data["variables"]:
-    print("sidebar colors are not present, assigning them...")
-    data["variables"].update(
-            {"sidebar_bg_color": data["variables"]["window_bg_color"]}
-            )
-    data["variables"].update(
-            {"sidebar_fg_color": data["variables"]["window_fg_color"]}
-            )
-    data["variables"].update(
-            {"sidebar_backdrop_color": data["variables"]["view_bg_color"]}
-            )
-    data["variables"].update(
-            {"sidebar_shade_color": data["variables"]["headerbar_shade_color"]}
-            )
-
-
-if args.debug:
-    print("Corrected Data:")
+
+class Colors:
+    """
+    a batch of colors held as columns (linear red,
+    green, blue and alpha), so that every operation
+    runs over the whole batch in one call. amounts
+    are a scalar for all colors or a list with one
+    value per color. lighten and darken work on the
+    OKLab lightness, mix in linear RGB
+    """
+
+    def __init__(self, r, g, b, a):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+    def __len__(self):
+        return len(self.r)
+
+    @classmethod
+    def parse(cls, values):
+        """
+        return type: Colors
+        description:
+          parse "#rgb", "#rrggbb", "#rrggbbaa", "rgb()"
+          and "rgba()" strings; ValueError for anything else
+        """
+        r, g, b, a = [], [], [], []
+        lut = SRGB_TO_LINEAR
+        for value in values:
+            value = value.strip()
+            if value.startswith("#"):
+                h = value[1:]
+                if len(h) in (3, 4):
+                    h = "".join(c * 2 for c in h)
+                if len(h) not in (6, 8):
+                    raise ValueError("not a color: {}".format(value))
+                n = int(h, 16)
+                if len(h) == 8:
+                    a.append((n & 0xff) / 255)
+                    n >>= 8
+                else:
+                    a.append(1.0)
+                r.append(lut[n >> 16])
+                g.append(lut[(n >> 8) & 0xff])
+                b.append(lut[n & 0xff])
+            elif value.startswith("rgb"):
+                parts = value[value.find("(") + 1:value.find(")")].split(",")
+                if len(parts) not in (3, 4):
+                    raise ValueError("not a color: {}".format(value))
+                r.append(lut[int(parts[0])])
+                g.append(lut[int(parts[1])])
+                b.append(lut[int(parts[2])])
+                a.append(float(parts[3]) if len(parts) == 4 else 1.0)
+            else:
+                raise ValueError("not a color: {}".format(value))
+        return cls(r, g, b, a)
+
+    def take(self, indices):
+        """the colors at indices, in that order"""
+        return Colors([self.r[i] for i in indices], [self.g[i] for i in indices],
+                      [self.b[i] for i in indices], [self.a[i] for i in indices])
+
+    def oklab(self):
+        """(L, a, b) columns"""
+        L, A, B = [], [], []
+        for r, g, b in zip(self.r, self.g, self.b):
+            l_ = (0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b) ** (1 / 3)
+            m_ = (0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b) ** (1 / 3)
+            s_ = (0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b) ** (1 / 3)
+            L.append(0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_)
+            A.append(1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_)
+            B.append(0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_)
+        return L, A, B
+
+    @classmethod
+    def from_oklab(cls, L, A, B, alpha):
+        r, g, b = [], [], []
+        for l, a_, b_ in zip(L, A, B):
+            l_ = (l + 0.3963377774 * a_ + 0.2158037573 * b_) ** 3
+            m_ = (l - 0.1055613458 * a_ - 0.0638541728 * b_) ** 3
+            s_ = (l - 0.0894841775 * a_ - 1.2914855480 * b_) ** 3
+            r.append(4.0767416621 * l_ - 3.3077115913 * m_ + 0.2309699292 * s_)
+            g.append(-1.2684380046 * l_ + 2.6097574011 * m_ - 0.3413193965 * s_)
+            b.append(-0.0041960863 * l_ - 0.7034186147 * m_ + 1.7076642189 * s_)
+        return cls(r, g, b, list(alpha))
+
+    def lighten(self, amount):
+        """move lightness amount (0-1) of the way to white"""
+        L, A, B = self.oklab()
+        L = [l + (1 - l) * t for l, t in zip(L, broadcast(amount, len(self)))]
+        return Colors.from_oklab(L, A, B, self.a)
+
+    def darken(self, amount):
+        """move lightness amount (0-1) of the way to black"""
+        L, A, B = self.oklab()
+        L = [l * (1 - t) for l, t in zip(L, broadcast(amount, len(self)))]
+        return Colors.from_oklab(L, A, B, self.a)
+
+    def mix(self, other, weight=0.5):
+        """weight (0-1) of other, blended in linear light"""
+        w = broadcast(weight, len(self))
+        return Colors(*([x + (y - x) * t for x, y, t in zip(mine, theirs, w)]
+                        for mine, theirs in ((self.r, other.r), (self.g, other.g),
+                                             (self.b, other.b), (self.a, other.a))))
+
+    def alpha(self, value):
+        return Colors(self.r, self.g, self.b, list(broadcast(value, len(self))))
+
+    def luminance(self):
+        """WCAG relative luminance of each color"""
+        return [0.2126 * r + 0.7152 * g + 0.0722 * b for r, g, b in zip(self.r, self.g, self.b)]
+
+    def contrast(self, other):
+        """WCAG contrast ratio of each color against other's"""
+        return [(max(x, y) + 0.05) / (min(x, y) + 0.05)
+                for x, y in zip(self.luminance(), other.luminance())]
+
+    def ensure_contrast(self, background, ratio=4.5, steps=16):
+        """
+        return type: Colors
+        description:
+          colors that already reach ratio against
+          background stay as they are; the others are
+          pushed towards white or black (whichever
+          contrasts more with their background) by the
+          smallest amount that reaches it, found by
+          bisecting all of them together
+        """
+        failing = [i for i, c in enumerate(self.contrast(background)) if c < ratio]
+        if not failing:
+            return self
+        fg, bg = self.take(failing), background.take(failing)
+        L, A, B = fg.oklab()
+        # towards white when it contrasts more with the background than black does
+        target = [1.0 if 1.05 / (y + 0.05) > (y + 0.05) / 0.05 else 0.0 for y in bg.luminance()]
+        low, high = [0.0] * len(failing), [1.0] * len(failing)
+        for _ in range(steps):
+            mid = [(lo + hi) / 2 for lo, hi in zip(low, high)]
+            trial = Colors.from_oklab([l + (t - l) * m for l, t, m in zip(L, target, mid)],
+                                      [a * (1 - m) for a, m in zip(A, mid)],
+                                      [b * (1 - m) for b, m in zip(B, mid)], fg.a)
+            reached = [c >= ratio for c in trial.contrast(bg)]
+            low = [lo if ok else m for lo, m, ok in zip(low, mid, reached)]
+            high = [m if ok else hi for hi, m, ok in zip(high, mid, reached)]
+        fixed = Colors.from_oklab([l + (t - l) * h for l, t, h in zip(L, target, high)],
+                                  [a * (1 - h) for a, h in zip(A, high)],
+                                  [b * (1 - h) for b, h in zip(B, high)], fg.a)
+        r, g, b, a = list(self.r), list(self.g), list(self.b), list(self.a)
+        for j, i in enumerate(failing):
+            r[i], g[i], b[i], a[i] = fixed.r[j], fixed.g[j], fixed.b[j], fixed.a[j]
+        return Colors(r, g, b, a)
+
+    def css(self):
+        """"#rrggbb", or "rgba()" for translucent colors, which gtk3 has no hex form for"""
+        out = []
+        for r, g, b, a in zip(self.r, self.g, self.b, self.a):
+            r, g, b = linear_to_srgb(r), linear_to_srgb(g), linear_to_srgb(b)
+            if a >= 1:
+                out.append("#{0:02x}{1:02x}{2:02x}".format(r, g, b))
+            else:
+                out.append("rgba({}, {}, {}, {:.3g})".format(r, g, b, a))
+        return out
+
+
+# The libadwaita variables of the pywal.json template as derivations of
+# pywal's 16 colors: (name, color, lighten by)
+DERIVED = [
+    ("accent_color", 12, 0), ("accent_bg_color", 12, 0), ("accent_fg_color", 12, 0.7),
+    ("destructive_color", 11, 0), ("destructive_bg_color", 3, 0), ("destructive_fg_color", 11, 0.7),
+    ("success_color", 13, 0), ("success_bg_color", 13, 0), ("success_fg_color", 15, 0),
+    ("warning_color", 14, 0), ("warning_bg_color", 6, 0), ("warning_fg_color", 15, 0),
+    ("error_color", 11, 0), ("error_bg_color", 3, 0), ("error_fg_color", 15, 0),
+    ("window_bg_color", 0, 0), ("window_fg_color", 15, 0),
+    ("view_bg_color", 0, 0.01), ("view_fg_color", 15, 0),
+    ("headerbar_bg_color", 0, 0), ("headerbar_fg_color", 15, 0),
+    ("headerbar_border_color", 0, 0.03), ("headerbar_backdrop_color", 4, 0),
+    ("headerbar_shade_color", 0, 0.02),
+    ("card_bg_color", 0, 0.02), ("card_fg_color", 15, 0), ("card_shade_color", 0, 0.01),
+    ("dialog_bg_color", 0, 0), ("dialog_fg_color", 15, 0),
+    ("popover_bg_color", 0, 0), ("popover_fg_color", 15, 0),
+    ("shade_color", 8, 0), ("scrollbar_outline_color", 12, 0),
+    ("sidebar_bg_color", 0, 0), ("sidebar_fg_color", 15, 0),
+    ("sidebar_backdrop_color", 0, 0.01), ("sidebar_shade_color", 0, 0.02),
+]
+
+
+# libadwaita's named palette, for themes derived from colors.json
+LIBADWAITA_PALETTE = {tint: dict(zip("12345", colors)) for tint, colors in {
+    "blue_": ("#99c1f1", "#62a0ea", "#3584e4", "#1c71d8", "#1a5fb4"),
+    "green_": ("#8ff0a4", "#57e389", "#33d17a", "#2ec27e", "#26a269"),
+    "yellow_": ("#f9f06b", "#f8e45c", "#f6d32d", "#f5c211", "#e5a50a"),
+    "orange_": ("#ffbe6f", "#ffa348", "#ff7800", "#e66100", "#c64600"),
+    "red_": ("#f66151", "#ed333b", "#e01b24", "#c01c28", "#a51d2d"),
+    "purple_": ("#dc8add", "#c061cb", "#9141ac", "#813d9c", "#613583"),
+    "brown_": ("#cdab8f", "#b5835a", "#986a44", "#865e3c", "#63452c"),
+    "light_": ("#ffffff", "#f6f5f4", "#deddda", "#c0bfbc", "#9a9996"),
+    "dark_": ("#77767b", "#5e5c64", "#3d3846", "#241f31", "#000000"),
+}.items()}
+
+
+def contrast_pairs(names):
+    """(foreground, background) variable names, e.g. window_fg_color on window_bg_color"""
+    return [(name, name.replace("_fg_", "_bg_")) for name in names
+            if "_fg_" in name and name.replace("_fg_", "_bg_") in names]
+
+
+def fix_contrast(variables, ratio=4.5, debug=False):
+    """
+    return type: void
+    description:
+      raise every *_fg_color that falls short of
+      ratio against its *_bg_color, all in one batch.
+      links and other non-colors are left alone
+    """
+    pairs = []
+    for fg, bg in contrast_pairs(variables):
+        try:
+            Colors.parse([variables[fg], variables[bg]])
+        except ValueError:
+            continue
+        pairs.append((fg, bg))
+    if not pairs:
+        return
+    fgs = Colors.parse([variables[fg] for fg, _ in pairs])
+    bgs = Colors.parse([variables[bg] for _, bg in pairs])
+    for (fg, _), before, after in zip(pairs, [variables[fg] for fg, _ in pairs],
+                                      fgs.ensure_contrast(bgs, ratio).css()):
+        if after.lower() != before.lower():
+            variables[fg] = after
+            if debug:
+                print("{}: {} -> {} for contrast".format(fg, before, after))
+
+
+def derive_variables(wal_colors, ratio=4.5):
+    """
+    return type: dict
+    description:
+      every libadwaita variable of DERIVED from pywal's
+      {"color0": "#...", ...}: one parse, one lighten
+      over all of them, one contrast pass over the
+      foregrounds, one conversion back to css
+    """
+    base = Colors.parse([wal_colors["color{}".format(i)] for i in range(16)])
+    derived = base.take([color for _, color, _ in DERIVED]).lighten([t for _, _, t in DERIVED])
+    variables = dict(zip((name for name, _, _ in DERIVED), derived.css()))
+    fix_contrast(variables, ratio)
+    return variables
+
+
+def bench(count=5000, rounds=5):
+    """time the batch engine against one color at a time, over count variables"""
+    import random
+    rng = random.Random(1)
+    values = ["#{:06x}".format(rng.randrange(1 << 24)) for _ in range(count)]
+    backgrounds = ["#{:06x}".format(rng.randrange(1 << 24)) for _ in range(count)]
+
+    def batched():
+        fg, bg = Colors.parse(values), Colors.parse(backgrounds)
+        return fg.lighten(0.1).mix(bg, 0.2).ensure_contrast(bg).css()
+
+    def one_at_a_time():
+        out = []
+        for value, background in zip(values, backgrounds):
+            fg, bg = Colors.parse([value]), Colors.parse([background])
+            out += fg.lighten(0.1).mix(bg, 0.2).ensure_contrast(bg).css()
+        return out
+
+    results = {}
+    for name, run in (("one at a time", one_at_a_time), ("batched", batched)):
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            results[name] = run()
+            best = min(best, time.perf_counter() - start)
+        print("{: <14} {:8.1f}ms for {} colors (lighten, mix, contrast, css)".format(
+            name, best * 1000, count))
+    same = results["batched"] == results["one at a time"]
+    print("outputs match" if same else "outputs DIFFER")
+    wal = {"color{}".format(i): values[i] for i in range(16)}
+    start = time.perf_counter()
+    derive_variables(wal)
+    print("derive_variables: {:.2f}ms for {} variables".format(
+        (time.perf_counter() - start) * 1000, len(DERIVED)))
+
+    # every variable an alias of the next, the last one a color
+    for size in (count // 10, count):
+        chain = {"v{}".format(i): "@v{}".format(i + 1) for i in range(size)}
+        chain["v{}".format(size)] = "#123456"
+        resolved_cache.clear()
+        start = time.perf_counter()
+        table = resolve_links(chain)
+        took = time.perf_counter() - start
+        same = same and set(table.values()) == {"#123456"}
+        print("resolve_links: {:.1f}ms for an alias chain {} deep".format(took * 1000, size))
+    start = time.perf_counter()
+    resolve_links(chain)
+    print("resolve_links: {:.1f}ms for the same chain again (cached)".format(
+        (time.perf_counter() - start) * 1000))
+    return 0 if same else 1
+
+
+def compile_css(data):
+    """
+    return type: dict
+    description:
+      render the "@define-color" lines of the
+      variables and the palette once, through a
+      single buffer, and return the stylesheet
+      of each gtk version: {"gtk-3.0": css, "gtk-4.0": css}
+    """
+    buf = io.StringIO()
+    for k, v in data["variables"].items():
+        buf.write("@define-color {} {};\n".format(k, v))
+    for tint, colors in data["palette"].items():
+        for ind, col in colors.items():
+            buf.write("@define-color {}{} {};\n".format(tint, ind, col))
+
+    shared = buf.tell()
+
+    css = {}
+    for gtk in ("gtk3", "gtk4"):
+        # the versions only differ in their custom css after the shared part
+        buf.seek(shared)
+        buf.truncate()
+        if "custom_css" in data:
+            buf.write("\n")
+            buf.write(data["custom_css"][gtk])
+        css["gtk-{}.0".format(gtk[-1])] = buf.getvalue()
+    return css
+
+
+def write_css(output_dir, output_string, debug=False):
+    """
+    return type: bool
+    description:
+      write output_string to output_dir/gtk.css
+      through a temporary file and a rename, so gtk
+      apps never see it half written; leave the file
+      (and its mtime) alone when the content is
+      unchanged. True when the file was written
+    """
+    out_file = os.path.join(output_dir, "gtk.css")
+    new = output_string.encode()
+    try:
+        with open(out_file, "rb") as f:
+            if f.read() == new:
+                if debug:
+                    print("{} is unchanged, not writing it".format(out_file))
+                return False
+    except OSError:
+        pass
+    if not os.path.exists(output_dir):
+        if debug:
+            print("dir {} does not exist, creating it".format(output_dir))
+        os.makedirs(output_dir)
+    tmp_file = "{}.{}.tmp".format(out_file, os.getpid())
+    with open(tmp_file, "wb") as of:
+        of.write(new)
+    os.replace(tmp_file, out_file)
+    return True
+
+
+def print_variables(data):
     print("Name:", data["name"])
     # print("Vars:", data["variables"])
     for keys, values in data["variables"].items():
         print("{key: >24}: {value}".format(key=keys, value=values))
 
-# construct output string to spit to css
-css_s: str = ""
 
-vars: str = ""
-for k, v in data["variables"].items():
-    vars = vars + "@define-color {} {};\n".format(k, v)
+def correct_data(data, debug=False):
+    """
+    return type: void
+    description:
+      fill in what older pywal.json templates
+      leave out, such as the sidebar colors; pywal's
+      own colors.json gets every variable derived
+    """
+    if "variables" not in data and "colors" in data:
+        data["name"] = "pywal"
+        data["variables"] = derive_variables(data["colors"])
+        data["palette"] = LIBADWAITA_PALETTE
+    # removing the rgba part is not needed here
+    # for keys, values in data["variables"].items():
+    #     data_rgb_to_hex(data["variables"], keys, values, debug)
+    if "sidebar_bg_color" not in data["variables"]:
+        print("sidebar colors are not present, assigning them...")
+        data["variables"].update(
+                {"sidebar_bg_color": data["variables"]["window_bg_color"]}
+                )
+        data["variables"].update(
+                {"sidebar_fg_color": data["variables"]["window_fg_color"]}
+                )
+        data["variables"].update(
+                {"sidebar_backdrop_color": data["variables"]["view_bg_color"]}
+                )
+        data["variables"].update(
+                {"sidebar_shade_color": data["variables"]["headerbar_shade_color"]}
+                )
+    data["variables"] = resolve_links(data["variables"], data.get("palette"), debug)
+    if debug:
+        print("Corrected Data:")
+        print_variables(data)
+
+
+def default_target():
+    username = os.environ["USER"]
+    home_dir = os.environ.get("HOME", "/home/{}".format(username))
+    return os.environ.get("XDG_CONFIG_HOME", "{}/.config".format(home_dir))
+
+
+def compile_theme(data, targets=None, debug=False, min_contrast=None):
+    """
+    return type: list
+    description:
+      correct data (a parsed pywal.json or colors.json)
+      and write its stylesheets to every target: a
+      PARENT dir containing the 'gtk-3.0' and 'gtk-4.0'
+      dirs, or a list of them ($XDG_CONFIG_HOME when
+      None). with min_contrast, foregrounds are raised
+      to that WCAG ratio against their backgrounds.
+      returns the gtk.css files that changed
+    """
+    if targets is None:
+        targets = [default_target()]
+    elif isinstance(targets, str):
+        targets = [targets]
+    correct_data(data, debug)
+    if min_contrast:
+        fix_contrast(data["variables"], min_contrast, debug)
 
-pal: str = ""
-for tint, _ in data["palette"].items():
-    for ind, col in data["palette"][tint].items():
-        pal = pal + "@define-color {}{} {};\n".format(tint, ind, col)
+    # construct the stylesheets to spit to css
+    css = compile_css(data)
+    if debug:
+        print("gtk3 stylesheet:")
+        print(css["gtk-3.0"])
+        print("")
+        print("gtk4 stylesheet:")
+        print(css["gtk-4.0"])
+        print("")
 
-css_s = vars + pal
+    written = []
+    for target_dir in targets:
+        for version, stylesheet in css.items():
+            output_dir = os.path.join(target_dir, version)
+            if write_css(output_dir, stylesheet, debug):
+                written.append(os.path.join(output_dir, "gtk.css"))
+    return written
 
-# print(css_s)
 
-gtk3: str = css_s
-gtk4: str = css_s
+def load(json_path, debug=False):
+    with open(json_path) as json_file:
+        data = json.load(json_file)
+    if debug:
+        print("Data read from file:", json_path)
+        print_variables(data)
+    return data
 
-if "custom_css" in data:
-    gtk3 = gtk3 + "\n" + data["custom_css"]["gtk3"]
-    gtk4 = gtk4 + "\n" + data["custom_css"]["gtk4"]
 
-if args.debug:
-    print("gtk3 stylesheet:")
-    print(gtk3)
-    print("")
-    print("gtk4 stylesheet:")
-    print(gtk4)
-    print("")
+##############
+# watch mode #
+##############
 
-if args.targ:
-    target_dir = "{}".format(args.targ)
-else:
-    username = os.environ["USER"]
-    home_dir = os.environ.get("HOME", "/home/{}".format(username))
-    xdg_conf = os.environ.get("XDG_CONFIG_HOME", "{}/.config".format(home_dir))
-    target_dir = "{}".format(xdg_conf)
-    # print(target_dir)
-
-target_gtk3 = "{}/gtk-3.0".format(target_dir)
-# print(target_gtk3)
-target_gtk4 = "{}/gtk-4.0".format(target_dir)
-# print(target_gtk4)
-
-
-def write_css(output_dir, output_string):
-    if os.path.exists(output_dir):
-        if args.debug:
-            print("dir {} exists".format(output_dir))
-    else:
-        if args.debug:
-            print("dir {} does not exist, creating it".format(output_dir))
-        os.mkdir(output_dir)
-    out_file = "{}/gtk.css".format(output_dir)
-    with open(out_file, "w") as of:
-        of.write(output_string)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+
+
+def watch(json_path, targets=None, debug=False, min_contrast=None):
+    """
+    return type: void
+    description:
+      compile once, then again every time json_path
+      is written (pywal) or renamed into place,
+      until killed. watches the parent dir through
+      inotify, since the file itself gets replaced
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    directory, name = os.path.split(os.path.abspath(json_path))
+    if fd < 0 or libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), directory)
+
+    def compile_now():
+        start = time.monotonic()
+        try:
+            written = compile_theme(load(json_path, debug), targets, debug, min_contrast)
+        except (OSError, ValueError, KeyError) as e:
+            print("could not compile {}: {}".format(json_path, e), file=sys.stderr)
+            return
+        print("compiled {} in {:.1f}ms, {} file(s) changed".format(
+            json_path, (time.monotonic() - start) * 1000, len(written)), flush=True)
+
+    if os.path.exists(json_path):
+        compile_now()
+    while True:
+        select.select([fd], [], [])
+        data = os.read(fd, 65536)
+        offset, changed = 0, False
+        while offset < len(data):
+            length = struct.unpack_from("iIII", data, offset)[3]
+            event_name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            changed = changed or os.fsdecode(event_name) == name
+            offset += 16 + length
+        if changed:
+            compile_now()
+
+
+def main():
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    # Adding optional argument
+    parser.add_argument("-f", "--file", default=WAL_JSON,
+                        help="JSON file to use (default: {}); pywal's "
+                        "colors.json has every variable derived".format(WAL_JSON))
+    parser.add_argument("-d", "--debug", action='store_true',
+                        help="Show Debug Output")
+    parser.add_argument(
+        "-t",
+        "--target",
+        dest="targ",
+        help="should be the PARENT dir "
+        "containing the 'gtk-3.0' and 'gtk-4.0' dirs "
+        "otherwise the target will default to: "
+        "$XDG_CONFIG_HOME",
+    )
+    parser.add_argument("-w", "--watch", action='store_true',
+                        help="keep running and recompile whenever "
+                        "the JSON file changes")
+    parser.add_argument("-c", "--min-contrast", type=float, metavar="RATIO",
+                        help="raise foreground colors to this WCAG "
+                        "contrast ratio against their backgrounds (4.5 for AA)")
+    parser.add_argument("--bench", type=int, nargs="?", const=5000, metavar="COLORS",
+                        help="time the color engine over this many colors and exit")
+
+    # Read arguments from command line
+    args = parser.parse_args()
+
+    if args.bench:
+        sys.exit(bench(args.bench))
+
+    if args.debug:
+        print("Displaying Debug Output of % s" % parser.prog)
+        print("File '{}' selected".format(args.file))
+
+    if args.watch:
+        try:
+            watch(args.file, args.targ, args.debug, args.min_contrast)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    compile_theme(load(args.file, args.debug), args.targ, args.debug, args.min_contrast)
 
 
-write_css(target_gtk3, gtk3)
-write_css(target_gtk4, gtk4)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+pywal_render: render ~/.config/wal/templates from pywal's colors, with caching
+Usage: pywal_render.py [colors.json]
+       pywal_render.py bench [rounds]
+       pywal_render.py check
+
+Each template is compiled once into a render function: the literal text
+between fields, and every field ({color0}, {color12.lighten(70%)},
+{background.rgb}, ...) parsed into a color and the modifiers to apply.
+Compiled templates are kept as marshalled code under CACHE_DIR, keyed by
+the template's hash. A template is rendered again only when the palette
+values it uses changed, outputs of palettes seen before come from CACHE_DIR,
+and an output file is replaced (atomically) only when its content changes.
+
+theme-apply.py runs wal with this renderer taking over the templates;
+without arguments the colors come from ~/.cache/wal/colors.json.
+"""
+import os
+import re
+import sys
+import json
+import time
+import marshal
+import hashlib
+import colorsys
+from pathlib import Path
+
+TEMPLATE_DIR = Path.home() / ".config/wal/templates"
+OUTPUT_DIR = Path.home() / ".cache/wal"
+COLORS_JSON = OUTPUT_DIR / "colors.json"
+CACHE_DIR = Path.home() / ".cache/pywal-render"
+OUTPUT_CACHE_SIZE = 256  # rendered outputs kept for palettes seen before
+FORMAT = 1  # bump when the compiled form changes
+
+# "{{", "}}" or a {field}, as str.format sees them
+TOKEN = re.compile(r"\{\{|\}\}|\{([^{}]*)\}")
+MODIFIER = re.compile(r"\.(\w+)(?:\(([^)]*)\))?")
+
+class TemplateError(ValueError):
+    """A template field this renderer (or pywal) cannot fill"""
+
+# -----------------------------
+# Color modifiers, as pywal does them
+# -----------------------------
+def hex_to_rgb(color):
+    return tuple(bytes.fromhex(color.lstrip("#")[:6]))
+
+def rgb_to_hex(rgb):
+    return "#{:02x}{:02x}{:02x}".format(*rgb)
+
+def lighten(color, amount):
+    return rgb_to_hex(int(c + (255 - c) * amount) for c in hex_to_rgb(color))
+
+def darken(color, amount):
+    return rgb_to_hex(int(c * (1 - amount)) for c in hex_to_rgb(color))
+
+def saturate(color, amount):
+    h, l, _ = colorsys.rgb_to_hls(*(c / 255 for c in hex_to_rgb(color)))
+    return rgb_to_hex(int(c * 255) for c in colorsys.hls_to_rgb(h, l, amount))
+
+# Modifiers that give another color, taking a percentage
+ADJUST = {"lighten": lighten, "darken": darken, "saturate": saturate}
+
+# Modifiers that end a field with a representation of the color
+PROPERTY = {
+    "strip": lambda color, alpha: color.lstrip("#"),
+    "rgb": lambda color, alpha: "{},{},{}".format(*hex_to_rgb(color)),
+    "rgba": lambda color, alpha: "{},{},{},{}".format(*hex_to_rgb(color), int(alpha) / 100),
+    "xrgba": lambda color, alpha: "{}/{}/{}/ff".format(*(color.lstrip("#")[i:i + 2] for i in (0, 2, 4))),
+    "red": lambda color, alpha: "{:.3f}".format(hex_to_rgb(color)[0] / 255),
+    "green": lambda color, alpha: "{:.3f}".format(hex_to_rgb(color)[1] / 255),
+    "blue": lambda color, alpha: "{:.3f}".format(hex_to_rgb(color)[2] / 255),
+}
+
+def palette_from(colors):
+    """{name: value} of everything a template can use, from pywal's colors.json"""
+    palette = {"wallpaper": colors.get("wallpaper", ""), "alpha": str(colors.get("alpha", "100")),
+               "checksum": colors.get("checksum", "")}
+    palette.update(colors.get("special", {}))
+    palette.update(colors["colors"])
+    return palette
+
+def field_value(palette, name, steps, prop):
+    """A parsed field filled from palette"""
+    value = palette[name]
+    if not steps and not prop:
+        return value
+    for adjust, amount in steps:
+        value = ADJUST[adjust](value, amount)
+    if prop:
+        return PROPERTY[prop](value, palette["alpha"])
+    return value.lstrip("#")  # like pywal, an adjusted color comes without its "#"
+
+# -----------------------------
+# Compiling
+# -----------------------------
+def parse_field(text, palette_names, where):
+    """("color12", (("lighten", 0.7),), None) from "color12.lighten(70%)" """
+    name, dot, rest = text.partition(".")
+    if name not in palette_names:
+        raise TemplateError(f"{where}: unknown field {{{text}}}")
+    steps, prop, end = [], None, 0
+    for match in MODIFIER.finditer("." + rest if dot else ""):
+        if match.start() != end or prop:
+            break
+        end = match.end()
+        modifier, argument = match.groups()
+        if modifier in ADJUST and argument is not None:
+            try:
+                steps.append((modifier, float(argument.rstrip("%")) / 100))
+            except ValueError:
+                raise TemplateError(f"{where}: bad amount in {{{text}}}") from None
+        elif modifier in PROPERTY and argument is None:
+            prop = modifier
+        else:
+            raise TemplateError(f"{where}: unknown modifier .{modifier} in {{{text}}}")
+    if dot and end != len(rest) + 1:
+        raise TemplateError(f"{where}: cannot parse {{{text}}}")
+    return name, tuple(steps), prop
+
+def compile_template(text, palette_names, where="template"):
+    """
+    Code of a render(values) function for the template text, and its
+    fields. render takes the filled fields in that order and returns the
+    output; the literal text is baked into the code as constants.
+    """
+    parts, fields, index, start, line = [""], [], {}, 0, 1
+    for match in TOKEN.finditer(text):
+        parts[-1] += text[start:match.start()]
+        line += text.count("\n", start, match.start())
+        start = match.end()
+        if match.group(1) is None:  # "{{" or "}}": a literal brace
+            parts[-1] += match.group()[0]
+            continue
+        field = parse_field(match.group(1), palette_names, f"{where}:{line}")
+        if field not in index:
+            index[field] = len(fields)
+            fields.append(field)
+        parts += [index[field], ""]
+    parts[-1] += text[start:]
+    code = ", ".join(f"values[{part}]" if isinstance(part, int) else repr(part) for part in parts if part != "")
+    source = "def render(values):\n    return ''.join((" + code + ",))\n"
+    return compile(source, where, "exec"), tuple(fields)
+
+class Template:
+    """One template file compiled to a render function, cached on disk by its hash"""
+
+    def __init__(self, path, palette_names):
+        self.path = Path(path)
+        data = self.path.read_bytes()
+        self.hash = hashlib.sha256(data + FORMAT.to_bytes(2, "big")).hexdigest()[:32]
+        cached = CACHE_DIR / "compiled" / f"{self.hash}.marshal"
+        try:
+            code, fields = marshal.loads(cached.read_bytes())
+            if not {name for name, _, _ in fields} <= set(palette_names):
+                raise ValueError
+        except (OSError, ValueError, EOFError, TypeError):
+            code, fields = compile_template(data.decode(), palette_names, str(self.path))
+            write_atomic(cached, marshal.dumps((code, fields)))
+        namespace = {}
+        exec(code, namespace)
+        self.render_values = namespace["render"]
+        self.fields = fields
+
+    def key(self, palette):
+        """Hash of the template and the palette values it uses"""
+        used = sorted({name for name, _, _ in self.fields})
+        return hashlib.sha256("\0".join([self.hash] + [palette[name] for name in used]).encode()).hexdigest()[:32]
+
+    def render(self, palette):
+        return self.render_values([field_value(palette, *field) for field in self.fields])
+
+# -----------------------------
+# Rendering
+# -----------------------------
+def write_atomic(path, data):
+    """Replace path with data unless it already holds exactly that; True when written"""
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    return True
+
+def trim_outputs():
+    """Keep the OUTPUT_CACHE_SIZE most recently used rendered outputs"""
+    try:
+        entries = sorted(os.scandir(CACHE_DIR / "outputs"), key=lambda e: e.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for entry in entries[OUTPUT_CACHE_SIZE:]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+def render_all(colors, template_dir=TEMPLATE_DIR, output_dir=OUTPUT_DIR):
+    """
+    Render every template in template_dir with pywal's colors (colors.json
+    as a dict) into output_dir. Returns {template name: "written",
+    "cached" (written from a previous render), "unchanged"}.
+    """
+    palette = palette_from(colors)
+    output_dir = Path(output_dir)
+    index_file = CACHE_DIR / "index.json"
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        index = {}
+    results = {}
+    for path in sorted(Path(template_dir).iterdir()):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+        template = Template(path, palette)
+        key = template.key(palette)
+        target = output_dir / path.name
+        try:
+            written = [key, target.stat().st_mtime_ns]
+        except OSError:
+            written = None
+        if written and index.get(path.name) == written:
+            results[path.name] = "unchanged"  # same template and colors, output untouched since
+            continue
+        stored = CACHE_DIR / "outputs" / key
+        try:
+            output = stored.read_bytes()
+            os.utime(stored)
+            how = "cached"
+        except OSError:
+            output = template.render(palette).encode()
+            write_atomic(stored, output)
+            how = "written"
+        if not write_atomic(target, output):
+            how = "unchanged"
+        index[path.name] = [key, target.stat().st_mtime_ns]
+        results[path.name] = how
+    write_atomic(index_file, json.dumps(index, indent=1, sort_keys=True).encode())
+    trim_outputs()
+    return results
+
+# -----------------------------
+# Check and benchmark
+# -----------------------------
+def sample_colors(seed=0):
+    import random
+    rng = random.Random(seed)
+    colors = {f"color{i}": "#{:06x}".format(rng.randrange(1 << 24)) for i in range(16)}
+    return {"wallpaper": f"/wallpapers/{seed}.png", "alpha": "100", "checksum": str(seed),
+            "special": {"background": colors["color0"], "foreground": colors["color15"],
+                        "cursor": colors["color15"]},
+            "colors": colors}
+
+def reference_render(text, palette):
+    """pywal's way: substitute modified fields, then str.format the rest"""
+    def modified(match):
+        name, steps, prop = parse_field(match.group(1), palette, "reference")
+        return field_value(palette, name, steps, prop)
+    text = re.sub(r"(?<!\{)\{([^{}]+\.[^{}]+)\}(?!\})", modified, text)
+    return text.format(**palette)
+
+def check():
+    """Render the repo's templates and compare with a str.format based renderer"""
+    import tempfile
+    global CACHE_DIR
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        CACHE_DIR = Path(tmp) / "cache"
+        for seed in (1, 2):
+            palette = palette_from(sample_colors(seed))
+            results = render_all(sample_colors(seed), TEMPLATE_DIR, Path(tmp) / "out")
+            for name in results:
+                expected = reference_render((TEMPLATE_DIR / name).read_text(), palette)
+                if (Path(tmp) / "out" / name).read_text() != expected:
+                    failures += 1
+                    print(f"FAILED: {name} differs from the reference render")
+        again = render_all(sample_colors(1), TEMPLATE_DIR, Path(tmp) / "out")
+        if set(again.values()) != {"cached"}:
+            failures += 1
+            print(f"FAILED: a palette seen before rendered again: {again}")
+        same = render_all(sample_colors(1), TEMPLATE_DIR, Path(tmp) / "out")
+        if set(same.values()) != {"unchanged"}:
+            failures += 1
+            print(f"FAILED: an unchanged palette wrote outputs: {same}")
+    if lighten("#000000", 0.7) != "#b2b2b2" or darken("#ffffff", 0.03) != "#f7f7f7":
+        failures += 1
+        print("FAILED: lighten/darken differ from pywal")
+    for bad in ("{nothing}", "{color1.glow(3%)}", "{color1.lighten(x%)}", "{}"):
+        try:
+            compile_template(bad, palette_from(sample_colors()))
+            failures += 1
+            print(f"FAILED: {bad} compiled")
+        except TemplateError:
+            pass
+    print("ok" if not failures else f"{failures} failures")
+    return 1 if failures else 0
+
+def bench(rounds=5):
+    """Full re-render versus this renderer, cold and with its caches warm"""
+    import tempfile
+    global CACHE_DIR
+    templates = [p for p in sorted(TEMPLATE_DIR.iterdir()) if p.is_file()]
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "out"
+
+        def timed(run):
+            best = float("inf")
+            for _ in range(rounds):
+                start = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - start)
+            return best * 1000
+
+        def reference():
+            palette = palette_from(sample_colors(1))
+            for path in templates:
+                write_atomic(out / path.name, reference_render(path.read_text(), palette).encode())
+
+        def cold():
+            global CACHE_DIR
+            CACHE_DIR = Path(tempfile.mkdtemp(dir=tmp))
+            render_all(sample_colors(1), TEMPLATE_DIR, out)
+
+        print(f"{len(templates)} templates")
+        print(f"  full re-render (pywal's way)   {timed(reference):8.1f}ms")
+        print(f"  cold: compile and render       {timed(cold):8.1f}ms")
+        CACHE_DIR = Path(tmp) / "warm"
+        render_all(sample_colors(1), TEMPLATE_DIR, out)
+        render_all(sample_colors(2), TEMPLATE_DIR, out)
+        fresh = iter(range(3, 10 ** 6))
+        print(f"  new palette, compiled          {timed(lambda: render_all(sample_colors(next(fresh)), TEMPLATE_DIR, out)):8.1f}ms")
+        flip = iter(range(10 ** 6))
+        print(f"  palette seen before            "
+              f"{timed(lambda: render_all(sample_colors(1 + next(flip) % 2), TEMPLATE_DIR, out)):8.1f}ms")
+        print(f"  same palette again             {timed(lambda: render_all(sample_colors(2), TEMPLATE_DIR, out)):8.1f}ms")
+    return 0
+
+def main():
+    args = sys.argv[1:]
+    if args == ["check"]:
+        sys.exit(check())
+    if 1 <= len(args) <= 2 and args[0] == "bench":
+        sys.exit(bench(*[int(a) for a in args[1:]]))
+    if len(args) > 1 or (args and args[0].startswith("-")):
+        print(__doc__.strip().splitlines()[1], file=sys.stderr)
+        sys.exit(1)
+    with open(args[0] if args else COLORS_JSON) as f:
+        colors = json.load(f)
+    start = time.monotonic()
+    try:
+        results = render_all(colors)
+    except TemplateError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    counts = {how: sum(1 for h in results.values() if h == how) for how in ("written", "cached", "unchanged")}
+    print(f"{len(results)} templates in {(time.monotonic() - start) * 1000:.1f}ms: "
+          + ", ".join(f"{n} {how}" for how, n in counts.items()))
+
+if __name__ == "__main__":
+    main()
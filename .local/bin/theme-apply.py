@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+theme-apply: apply a wallpaper's pywal theme to every app, in parallel
+Usage: theme-apply.py [--force] <wallpaper>
+       theme-apply.py --steps
+
+Each step declares the files it reads and the steps it comes after; steps
+whose dependencies are done run together in a worker pool, so applying a
+theme takes about as long as wal plus the slowest step instead of the sum
+of all of them. A step whose inputs hash the same as the last time it
+succeeded is skipped (--force runs everything). Per-step timings are
+printed at the end. wal-set runs this after waypaper sets a wallpaper.
+wal only picks the colors; pywal_render.py renders ~/.config/wal/templates,
+skipping those whose colors did not change.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+HOME = Path.home()
+BIN_DIR = Path(__file__).resolve().parent  # gtk.py lives next to us
+WAL_CACHE = HOME / ".cache/wal"
+STATE_FILE = HOME / ".cache/theme-apply/state.json"
+TEMPLATE_DIR = HOME / ".config/wal/templates"
+NO_TEMPLATES = HOME / ".cache/theme-apply/config"  # wal's config home, without templates
+WORKERS = int(os.environ.get("THEME_APPLY_WORKERS", "4"))
+
+KVANTUM_THEME = HOME / ".config/Kvantum/pywal"
+YAZI_FLAVOR = HOME / ".config/yazi/flavors/pywal.yazi/flavor.toml"
+MAKO_CONFIG = HOME / ".config/mako/config"
+ZATHURA_CONFIG = HOME / ".config/zathura/zathurarc"
+SPICETIFY_COLORS = HOME / ".config/spicetify/Themes/text/color.ini"
+HYPRLOCK_CONFIG = HOME / ".config/hypr/hyprlock.conf"
+
+# name: the step; inputs(wallpaper): files (or strings) whose content decides
+# whether it has to run; after: steps it needs; run(wallpaper): does it
+Step = namedtuple("Step", "name inputs after run")
+
+class StepError(Exception):
+    """A step could not do its job; the message says why"""
+
+def copy(source, target):
+    """Install a rendered template; os.replace so readers never see half a file"""
+    if not source.exists():
+        raise StepError(f"{source} not found")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}")
+    shutil.copyfile(source, tmp)
+    tmp.replace(target)
+
+def run(*argv, env=None):
+    proc = subprocess.run(argv, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True)
+    if proc.returncode:
+        raise StepError(f"{argv[0]} failed: {proc.stderr.strip() or f'exit {proc.returncode}'}")
+
+# -----------------------------
+# Steps
+# -----------------------------
+def wal(wallpaper):
+    # Our templates are rendered by pywal_render.py in the next step
+    (NO_TEMPLATES / "wal").mkdir(parents=True, exist_ok=True)
+    run("wal", "-qn", "--cols16", "darken", "-i", wallpaper,
+        env={**os.environ, "XDG_CONFIG_HOME": str(NO_TEMPLATES)})
+
+def templates(wallpaper):
+    if str(BIN_DIR) not in sys.path:
+        sys.path.insert(0, str(BIN_DIR))
+    import pywal_render
+    try:
+        with open(WAL_CACHE / "colors.json") as f:
+            pywal_render.render_all(json.load(f), TEMPLATE_DIR, WAL_CACHE)
+    except pywal_render.TemplateError as e:
+        raise StepError(str(e)) from None
+
+def hyprlock(wallpaper):
+    if not HYPRLOCK_CONFIG.exists():
+        raise StepError(f"{HYPRLOCK_CONFIG} not found")
+    text = HYPRLOCK_CONFIG.read_text()
+    new = re.sub(r"(?m)^\$wallpaper = .*$", lambda m: f"$wallpaper = {wallpaper}", text)
+    if new != text:
+        tmp = HYPRLOCK_CONFIG.with_name(f".{HYPRLOCK_CONFIG.name}.{os.getpid()}")
+        tmp.write_text(new)
+        tmp.replace(HYPRLOCK_CONFIG)
+
+def gtk(wallpaper):
+    # In-process, through gtk.py's API: no interpreter start
+    if str(BIN_DIR) not in sys.path:
+        sys.path.insert(0, str(BIN_DIR))
+    import gtk as gtk_theme
+    with open(WAL_CACHE / "pywal.json") as f:
+        gtk_theme.compile_theme(json.load(f), str(HOME / ".config"))
+
+def kvantum(wallpaper):
+    KVANTUM_THEME.mkdir(parents=True, exist_ok=True)
+    for suffix in (".kvconfig", ".svg"):
+        link, target = KVANTUM_THEME / f"pywal{suffix}", WAL_CACHE / f"pywal{suffix}"
+        if not link.is_symlink():
+            if not target.exists():
+                raise StepError(f"{target} not found")
+            link.symlink_to(target)
+
+def yazi(wallpaper):
+    copy(WAL_CACHE / "yazi-flavor.toml", YAZI_FLAVOR)
+
+def mako(wallpaper):
+    copy(WAL_CACHE / "mako", MAKO_CONFIG)
+    run("makoctl", "reload")
+
+def zathura(wallpaper):
+    copy(WAL_CACHE / "zathurarc", ZATHURA_CONFIG)
+
+def spicetify(wallpaper):
+    copy(WAL_CACHE / "spicetify-colors.ini", SPICETIFY_COLORS)
+    run("spicetify", "config", "current_theme", "text", "color_scheme", "pywal")
+
+def qutebrowser(wallpaper):
+    if subprocess.run(["pgrep", "-x", "qutebrowser"], stdout=subprocess.DEVNULL).returncode == 0:
+        run("qutebrowser", "--target", "window", ":config-source")
+
+STEPS = [
+    Step("wal", lambda wp: [wp, Path(wp)], [], wal),
+    Step("templates", lambda wp: [WAL_CACHE / "colors.json", *sorted(TEMPLATE_DIR.glob("*"))], ["wal"], templates),
+    Step("hyprlock", lambda wp: [wp], [], hyprlock),
+    Step("gtk", lambda wp: [WAL_CACHE / "pywal.json"], ["templates"], gtk),
+    Step("kvantum", lambda wp: [WAL_CACHE / "pywal.kvconfig", WAL_CACHE / "pywal.svg"], ["templates"], kvantum),
+    Step("yazi", lambda wp: [WAL_CACHE / "yazi-flavor.toml"], ["templates"], yazi),
+    Step("mako", lambda wp: [WAL_CACHE / "mako"], ["templates"], mako),
+    Step("zathura", lambda wp: [WAL_CACHE / "zathurarc"], ["templates"], zathura),
+    Step("spicetify", lambda wp: [WAL_CACHE / "spicetify-colors.ini"], ["templates"], spicetify),
+    Step("qutebrowser", lambda wp: [WAL_CACHE / "qutebrowser-config.py"], ["templates"], qutebrowser),
+]
+
+# -----------------------------
+# Executor
+# -----------------------------
+def fingerprint(inputs):
+    """Hash of the given strings and file contents; a missing file hashes as missing"""
+    digest = hashlib.sha256()
+    for item in inputs:
+        if isinstance(item, Path):
+            try:
+                digest.update(item.read_bytes())
+            except OSError:
+                digest.update(b"\0missing")
+        else:
+            digest.update(item.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def load_state():
+    try:
+        return json.loads(STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(f".{os.getpid()}")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    tmp.replace(STATE_FILE)
+
+def apply(wallpaper, steps=STEPS, force=False, workers=WORKERS):
+    """
+    Run steps for wallpaper in dependency order, independent ones
+    concurrently. Returns {name: (outcome, seconds)}, outcome being "ok",
+    "unchanged", "skipped" (a dependency failed) or the error message.
+    """
+    names = {step.name for step in steps}
+    for step in steps:
+        if not names.issuperset(step.after):
+            raise ValueError(f"{step.name} comes after unknown steps {set(step.after) - names}")
+    state = load_state()
+    results = {}
+    waiting = {step.name: step for step in steps}
+    running = {}
+
+    def attempt(step):
+        # Inputs are hashed when the step is due, after wal rewrote them
+        start = time.monotonic()
+        key = fingerprint(step.inputs(wallpaper))
+        if not force and state.get(step.name) == key:
+            return "unchanged", time.monotonic() - start, None
+        try:
+            step.run(wallpaper)
+        except (StepError, OSError) as e:
+            return str(e), time.monotonic() - start, None
+        return "ok", time.monotonic() - start, key
+
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        while waiting or running:
+            for name, step in list(waiting.items()):
+                if any(dep not in results for dep in step.after):
+                    continue
+                del waiting[name]
+                if any(results[dep][0] not in ("ok", "unchanged") for dep in step.after):
+                    results[name] = ("skipped", 0.0)
+                    continue
+                running[pool.submit(attempt, step)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                outcome, seconds, key = future.result()
+                results[name] = (outcome, seconds)
+                if key:
+                    state[name] = key
+    save_state(state)
+    return results
+
+def report(results, total):
+    for step in STEPS:
+        if step.name in results:
+            outcome, seconds = results[step.name]
+            print(f"  {step.name:<12} {seconds * 1000:8.1f}ms  {outcome}")
+    busy = sum(seconds for _, seconds in results.values())
+    print(f"themed in {total:.2f}s (steps add up to {busy:.2f}s)")
+
+def main():
+    args = sys.argv[1:]
+    if args == ["--steps"]:
+        for step in STEPS:
+            print(f"{step.name:<12} after: {', '.join(step.after) or '-'}")
+        return
+    force = "--force" in args
+    if force:
+        args.remove("--force")
+    if len(args) != 1:
+        print(__doc__.strip().splitlines()[1], file=sys.stderr)
+        sys.exit(1)
+    wallpaper = os.path.abspath(os.path.expanduser(args[0]))
+    print(f"Applying theme for: {wallpaper}")
+    start = time.monotonic()
+    results = apply(wallpaper, force=force)
+    report(results, time.monotonic() - start)
+    failed = [name for name, (outcome, _) in results.items() if outcome not in ("ok", "unchanged")]
+    for name in failed:
+        print(f"Error: {name}: {results[name][0]}", file=sys.stderr)
+    if "wal" in failed:
+        sys.exit(1)
+    try:
+        run("notify-send", "Theme Updated", f"Wallpaper set to: {os.path.basename(wallpaper)}")
+    except (StepError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
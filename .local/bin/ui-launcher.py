@@ -2,207 +2,1372 @@
 """
 ui-launcher: Simple exclusive UI app launcher for Hyprland
 Usage: ui-launcher.py <app-name>
+       ui-launcher.py daemon
+       ui-launcher.py stats
+       ui-launcher.py bench <app-name> [rounds]
+       ui-launcher.py bench window <app-name> [rounds]
+       ui-launcher.py bench tree [depth] [width] [max-ms]
+       ui-launcher.py bench state [workers] [toggles]
+       ui-launcher.py bench hyprland
+
+In daemon mode the app table and the running child are kept in memory and
+toggles arrive over a Unix socket as one "toggle <app-name>" line each, so
+any client works:
+    echo "toggle rofi" | socat - UNIX-CONNECT:$XDG_RUNTIME_DIR/ui-launcher.sock
+The keybinds use ui-toggle, which does exactly that and only starts Python
+when no daemon is listening. Invoking this script with an app name also
+goes through the daemon when one is listening and falls back to the
+one-shot path otherwise.
+
+Setting UI_LAUNCHER_TRACE=1 (or passing --trace) appends per-phase timings
+of every toggle to TRACE_LOG as JSON lines; "stats" summarises them.
 """
 import sys
 import os
 import subprocess
 import time
-import threading
+import heapq
+import json
 import shlex
 import signal
+import socket
+import selectors
+import select
+import traceback
+import struct
+import shutil
+import fcntl
+import mmap
+import contextlib
+import functools
+from collections import namedtuple
 
 TIMEOUT = 60
+TOGGLE_TIMEOUT = 10  # well past a daemon toggle's worst case of IPC timeouts and grace
 STATEFILE = "/tmp/ui-launcher-state"
+SOCKET = os.environ.get("UI_LAUNCHER_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "ui-launcher.sock")
 
-# Define apps
-UI_APPS = {
-    "rofi": f"{os.path.expanduser('~')}/.config/rofi/scripts/launcher.sh",
-    "rofi-powermenu": f"{os.path.expanduser('~')}/.config/rofi/scripts/powermenu.sh",
-    "rofi-screenshot": f"{os.path.expanduser('~')}/.config/rofi/scripts/screenshot.sh",
-    "clipse": ["kitty", "--class", "clipse", "-e", "clipse"],
-    "floating-selector": ["kitty", "--class=floating-selector", "-e", "bash", "-c", f"{os.path.expanduser('~')}/.local/bin/quick-edit"],
-    "waypaper": "waypaper"
-}
+# The app table lives in REGISTRY (TOML, or JSON when it ends in .json) and
+# is compiled into REGISTRY_CACHE, so a cold toggle only stats the registry
+REGISTRY = os.environ.get("UI_LAUNCHER_APPS") or os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "ui-launcher", "apps.toml")
+REGISTRY_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ui-launcher", "apps.json")
+REGISTRY_FORMAT = 1
 
-HYPRLAND_APPS = {
-    "clipse": "clipse",
-    "floating-selector": "floating-selector",
-    "waypaper": "waypaper"
+# Traced toggles go here; past TRACE_MAX_BYTES the log becomes TRACE_LOG.1,
+# so at most two generations are kept
+TRACE_LOG = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"), "ui-launcher", "trace.jsonl")
+TRACE_MAX_BYTES = 256 * 1024
+
+# Used when REGISTRY is missing or broken
+DEFAULT_APPS = {
+    "defaults": {"group": "ui"},
+    "apps": {
+        "rofi": {"command": "~/.config/rofi/scripts/launcher.sh"},
+        "rofi-powermenu": {"command": "~/.config/rofi/scripts/powermenu.sh"},
+        "rofi-screenshot": {"command": "~/.config/rofi/scripts/screenshot.sh"},
+        "clipse": {"command": ["kitty", "--class", "clipse", "-e", "clipse"],
+                   "class": "clipse", "prewarm": 1},
+        "floating-selector": {"command": ["kitty", "--class=floating-selector", "-e", "bash", "-c",
+                                          "~/.local/bin/quick-edit"],
+                              "class": "floating-selector", "prewarm": 1},
+        "waypaper": {"command": "waypaper", "class": "waypaper"}
+    }
 }
 
+# Daemon mode drops hidden, ready windows after PREWARM_IDLE seconds without a toggle
+PREWARM_IDLE = 900
+POOL_WORKSPACE = "special:ui-launcher"
+
+# -----------------------------
+# App registry
+# -----------------------------
+App = namedtuple("App", "name argv klass timeout group prewarm")
+
+def parse_registry(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    import tomllib  # only paid for when the cache is stale
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+def compile_apps(raw):
+    """
+    Turn the registry's [defaults] and [apps.<name>] tables into App records
+    with argv already split and expanded. Raises ValueError on a bad entry.
+    """
+    defaults = raw.get("defaults", {})
+    apps = {}
+    for name, spec in raw.get("apps", {}).items():
+        spec = {**defaults, **spec}
+        command = spec.get("command")
+        if isinstance(command, str):
+            argv = shlex.split(command)
+        elif isinstance(command, list) and all(isinstance(a, str) for a in command):
+            argv = list(command)
+        else:
+            raise ValueError(f"app {name!r}: command must be a string or a list of strings")
+        try:
+            apps[name] = App(name, [os.path.expanduser(a) for a in argv], spec.get("class"),
+                             float(spec.get("timeout", TIMEOUT)), str(spec.get("group", name)),
+                             int(spec.get("prewarm", 0)))
+        except (TypeError, ValueError):
+            raise ValueError(f"app {name!r}: timeout and prewarm must be numbers")
+    return apps
+
+class Registry:
+    """The compiled app table, reloaded only when REGISTRY changes on disk"""
+
+    def __init__(self, path=REGISTRY, cache=REGISTRY_CACHE):
+        self.path = path
+        self.cache = cache
+        self.key = None
+        self.apps = {}
+        self.refresh()
+
+    def refresh(self):
+        """Pick up registry edits; returns True when the table was reloaded"""
+        try:
+            st = os.stat(self.path)
+            key = [self.path, st.st_mtime_ns, st.st_size, REGISTRY_FORMAT]
+        except OSError:
+            key = None
+        if self.apps and key == self.key:
+            return False
+        self.key = key
+        self.apps = self.load(key)
+        return True
+
+    def load(self, key):
+        if key is None:
+            return compile_apps(DEFAULT_APPS)
+        try:
+            with open(self.cache) as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return {name: App(*fields) for name, fields in cached["apps"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        try:
+            apps = compile_apps(parse_registry(self.path))
+        except (OSError, ValueError) as e:
+            print(f"ui-launcher: ignoring {self.path}: {e}", file=sys.stderr)
+            return compile_apps(DEFAULT_APPS)
+        try:
+            os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+            tmp = f"{self.cache}.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "apps": apps}, f)
+            os.replace(tmp, self.cache)
+        except OSError:
+            pass  # the cache only saves the next cold start a parse
+        return apps
+
+    def __contains__(self, app):
+        return app in self.apps
+
+    def __getitem__(self, app):
+        return self.apps[app]
+
+    def __iter__(self):
+        return iter(self.apps)
+
+    def get(self, app):
+        return self.apps.get(app)
+
+    def group(self, app):
+        # Entries for apps dropped from the registry belong to no group
+        known = self.apps.get(app)
+        return known.group if known else None
+
+    def classes(self, apps):
+        """Window classes of apps that have one"""
+        return {self.apps[app].klass for app in apps if app in self.apps and self.apps[app].klass}
+
+APPS = Registry()
+
+# -----------------------------
+# Tracing
+# -----------------------------
+def process_age():
+    """Seconds since this process started, at clock tick resolution"""
+    with open("/proc/self/stat", "rb") as f:
+        stat = f.read()
+    ticks = int(stat[stat.rindex(b")") + 2:].split()[19])
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf("SC_CLK_TCK")
+
+class Tracer:
+    """Per-phase timings of one toggle, written to TRACE_LOG when enabled"""
+
+    def __init__(self):
+        self.enabled = bool(os.environ.get("UI_LAUNCHER_TRACE"))
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.start = time.monotonic()
+
+    def add(self, name, seconds):
+        # Phases that run more than once per toggle add up
+        self.phases[name] = self.phases.get(name, 0.0) + seconds * 1000
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def traced(self, name):
+        """Decorator timing every call of a function as phase name"""
+        def wrap(func):
+            @functools.wraps(func)
+            def call(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.phase(name):
+                    return func(*args, **kwargs)
+            return call
+        return wrap
+
+    def flush(self, mode, app, result, total=None):
+        if not self.enabled:
+            return
+        if total is None:
+            total = time.monotonic() - self.start
+        record = {"time": time.time(), "mode": mode, "app": app, "result": result,
+                  "phases": {**self.phases, "total": total * 1000}}
+        self.reset()
+        try:
+            os.makedirs(os.path.dirname(TRACE_LOG), exist_ok=True)
+            with open(TRACE_LOG, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                # Still the live log after waiting for the lock? Then rotate
+                if f.tell() > TRACE_MAX_BYTES and os.fstat(f.fileno()).st_ino == os.stat(TRACE_LOG).st_ino:
+                    os.replace(TRACE_LOG, f"{TRACE_LOG}.1")
+        except OSError:
+            pass  # tracing must never break a toggle
+
+TRACE = Tracer()
+
 def is_running(pid: int) -> bool:
     try:
-        os.kill(pid, 0)
-        return True
-    except (OSError, ProcessLookupError):
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
         return False
+    # Zombies still answer kill(pid, 0) but are already gone for our purposes
+    return stat[stat.rindex(b")") + 2:stat.rindex(b")") + 3] != b"Z"
+
+def process_children():
+    """Map every pid to its children with a single pass over /proc"""
+    children = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm may contain spaces and parens, so split after the last ')'
+        ppid = int(stat[stat.rindex(b")") + 2:].split(None, 2)[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    return children
 
-def kill_process_tree(pid):
+@TRACE.traced("kill_tree")
+def kill_process_tree(pid, grace=0.2):
+    """SIGTERM the whole tree at once, then SIGKILL whatever outlives grace"""
     if not is_running(pid):
         return
+    children = process_children()
+    tree = [pid]
+    for node in tree:
+        tree.extend(children.get(node, ()))
+
+    # Launched apps lead their own process group, which also catches
+    # descendants that were reparented away from the tree
     try:
-        # Get children with timeout
-        result = subprocess.run(['pgrep', '-P', str(pid)],
-                                capture_output=True, text=True, timeout=1.0)
-        children = result.stdout.strip().split('\n') if result.stdout.strip() else []
-        for child in children:
-            if child and child.isdigit():
-                kill_process_tree(int(child))
-        
-        # Try SIGTERM first, then SIGKILL if needed
-        os.kill(pid, signal.SIGTERM)
-        time.sleep(0.02)  # Brief pause to allow graceful shutdown
-        if is_running(pid):
-            os.kill(pid, signal.SIGKILL)
-    except (subprocess.TimeoutExpired, Exception):
-        # If anything hangs or fails, force kill
-        try:
-            os.kill(pid, signal.SIGKILL)
-        except:
+        os.killpg(pid, signal.SIGTERM)
+    except OSError:
+        pass
+    for node in tree:
+        try:
+            os.kill(node, signal.SIGTERM)
+        except OSError:
             pass
 
-def kill_hyprland_window(class_name):
+    deadline = time.monotonic() + grace
+    alive = tree
+    while alive and time.monotonic() < deadline:
+        time.sleep(0.005)
+        alive = [node for node in alive if is_running(node)]
+
     try:
-        subprocess.run(['hyprctl', 'dispatch', 'signalwindow', f'class:{class_name},9'],
-                       stderr=subprocess.DEVNULL, timeout=1.0)
-    except (subprocess.TimeoutExpired, Exception):
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
         pass
+    for node in alive:
+        try:
+            os.kill(node, signal.SIGKILL)
+        except OSError:
+            pass
 
-def cleanup_stale_state():
-    """Remove state file if process is already dead"""
-    if not os.path.exists(STATEFILE):
-        return
-    try:
-        with open(STATEFILE, 'r') as f:
-            data = f.read().strip()
+# -----------------------------
+# Hyprland IPC
+# -----------------------------
+class Hyprland:
+    """
+    Talks to Hyprland's sockets directly instead of forking hyprctl.
+    .socket.sock takes one request per connection; .socket2.sock is the event
+    stream, used to keep an address -> class map of open windows and to see
+    when a closed window is really gone.
+    """
+
+    def __init__(self, base=None):
+        signature = os.environ.get("HYPRLAND_INSTANCE_SIGNATURE")
+        runtime = os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
+        if not base and signature:
+            base = os.path.join(runtime, "hypr", signature)
+        self.base = base
+        self.persistent = False  # the daemon keeps the event stream open
+        self.events = None
+        self.pending = b""
+        self.windows = {}   # address (no 0x) -> class, while subscribed
+        self.closing = set()
+        self.hidden = set()  # pooled windows that close_windows must leave alone
+        self.listeners = []  # callables(event, payload) run for every event line
+
+    def request(self, payload, timeout=1.0):
+        if not self.base:
+            return ""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(os.path.join(self.base, ".socket.sock"))
+                sock.sendall(payload.encode())
+                chunks = []
+                while chunk := sock.recv(65536):
+                    chunks.append(chunk)
+            return b"".join(chunks).decode(errors="replace")
+        except OSError:
+            return ""
+
+    def dispatch(self, *commands):
+        """Run dispatchers, batched into a single request when there are several"""
+        if len(commands) == 1:
+            return self.request(f"dispatch {commands[0]}")
+        if commands:
+            return self.request("[[BATCH]]" + ";".join(f"dispatch {c}" for c in commands))
+
+    def clients(self):
+        try:
+            return json.loads(self.request("j/clients") or "[]")
+        except ValueError:
+            return []
+
+    def subscribe(self):
+        if self.events or not self.base:
+            return self.events
+        try:
+            self.events = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.events.connect(os.path.join(self.base, ".socket2.sock"))
+            self.events.setblocking(False)
+        except OSError:
+            self.events = None
+            return None
+        self.windows = {c["address"].removeprefix("0x"): c["class"] for c in self.clients()}
+        return self.events
+
+    def unsubscribe(self):
+        if self.events:
+            self.events.close()
+        self.events = None
+        self.pending = b""
+
+    def pump(self):
+        """Consume whatever events are buffered; False once Hyprland hung up"""
+        try:
+            data = self.events.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b""
         if not data:
-            os.unlink(STATEFILE)
-            return
-        if ',' in data:
-            prev_pid, prev_app = data.split(',', 1)
-            prev_pid = int(prev_pid)
+            self.unsubscribe()
+            return False
+        *lines, self.pending = (self.pending + data).split(b"\n")
+        for line in lines:
+            event, _, payload = line.decode(errors="replace").partition(">>")
+            if event == "openwindow":
+                fields = payload.split(",", 3)
+                if len(fields) == 4:
+                    self.windows[fields[0]] = fields[2]
+            elif event == "closewindow":
+                self.windows.pop(payload, None)
+                self.closing.discard(payload)
+                self.hidden.discard(payload)
+            for listener in self.listeners:
+                listener(event, payload)
+        return True
+
+    @TRACE.traced("close_windows")
+    def close_windows(self, classes):
+        """Kill every window of the given classes; returns their addresses"""
+        if not classes or not self.base:
+            return set()
+        self.subscribe()
+        if self.events:
+            addresses = {a for a, c in self.windows.items() if c in classes}
         else:
-            prev_pid = int(data)
-        
-        # If process is dead, clean up state
-        if not is_running(prev_pid):
-            os.unlink(STATEFILE)
-    except (ValueError, FileNotFoundError):
-        try:
-            os.unlink(STATEFILE)
-        except:
-            pass
+            addresses = {c["address"].removeprefix("0x") for c in self.clients()
+                         if c["class"] in classes}
+        addresses -= self.hidden
+        self.closing |= addresses
+        self.dispatch(*[f"signalwindow address:0x{a},9" for a in sorted(addresses)])
+        return addresses
 
-def kill_previous(app_name):
-    cleanup_stale_state()
-    if not os.path.exists(STATEFILE):
-        return
+    @TRACE.traced("wait_closed")
+    def wait_closed(self, addresses, timeout=0.25):
+        """Block until Hyprland reports the windows closed, or timeout passes"""
+        deadline = time.monotonic() + timeout
+        while addresses & self.closing and self.events:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            select.select([self.events], [], [], remaining)
+            self.pump()
+        if addresses and not self.events:
+            time.sleep(0.05)  # no event stream, small buffer for Hyprland
+        self.closing -= addresses
+
+    def release(self):
+        """Drop the event stream again unless the daemon is keeping it"""
+        if not self.persistent:
+            self.unsubscribe()
+
+HYPRLAND = Hyprland()
+
+# -----------------------------
+# State store
+# -----------------------------
+Entry = namedtuple("Entry", "pid app start_ticks started")
+
+def process_start(pid):
+    """Kernel start time of a live process, used to tell a reused pid apart"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rindex(b")") + 2:].split()
+    return None if fields[0] == b"Z" else int(fields[19])
+
+def boot_id():
     try:
-        with open(STATEFILE, 'r') as f:
-            data = f.read().strip()
-            if ',' in data:
-                prev_pid, prev_app = data.split(',', 1)
-                prev_pid = int(prev_pid)
+        with open("/proc/sys/kernel/random/boot_id", "rb") as f:
+            return bytes.fromhex(f.read().strip().replace(b"-", b"").decode())
+    except (OSError, ValueError):
+        return bytes(16)
+
+class StateStore:
+    """
+    Launched apps as fixed-size records in a memory-mapped file. Use it as a
+    context manager: the file is flock()ed and parsed once on entry, entries
+    whose process died or whose pid was reused are dropped, and changes are
+    written back on exit.
+    """
+
+    HEADER = struct.Struct("<4s16s")
+    RECORD = struct.Struct("<iQd48s")
+    MAGIC = b"UIL1"
+    SLOTS = 32
+    SIZE = HEADER.size + SLOTS * RECORD.size
+
+    def __init__(self, path=STATEFILE):
+        self.path = path
+        self.entries = []
+        self.dirty = False
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with TRACE.phase("state_lock"):
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            if os.fstat(self.fd).st_size != self.SIZE:
+                os.ftruncate(self.fd, 0)  # old text format or torn file, start over
+                os.ftruncate(self.fd, self.SIZE)
+            self.map = mmap.mmap(self.fd, self.SIZE)
+        except BaseException:
+            os.close(self.fd)  # also drops the lock
+            raise
+        magic, boot = self.HEADER.unpack_from(self.map)
+        self.boot = boot_id()
+        if magic != self.MAGIC or boot != self.boot:
+            self.dirty = True
+            return self
+        for slot in range(self.SLOTS):
+            pid, ticks, started, app = self.RECORD.unpack_from(
+                self.map, self.HEADER.size + slot * self.RECORD.size)
+            if not pid:
+                continue
+            entry = Entry(pid, app.rstrip(b"\0").decode(), ticks, started)
+            if process_start(pid) == ticks:
+                self.entries.append(entry)
             else:
-                prev_pid = int(data)
-                prev_app = None
+                self.dirty = True
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self.dirty:
+                records = [self.RECORD.pack(e.pid, e.start_ticks, e.started, e.app.encode())
+                           for e in self.entries[:self.SLOTS]]
+                records.append(bytes((self.SLOTS - len(records)) * self.RECORD.size))
+                self.map[:] = self.HEADER.pack(self.MAGIC, self.boot) + b"".join(records)
+        finally:
+            self.map.close()
+            os.close(self.fd)  # also drops the lock
+
+    def find(self, app):
+        return next((e for e in self.entries if e.app == app), None)
+
+    def get(self, pid):
+        return next((e for e in self.entries if e.pid == pid), None)
+
+    def add(self, pid, app):
+        self.entries.append(Entry(pid, app, process_start(pid) or 0, time.time()))
+        self.dirty = True
+
+    def remove(self, pid):
+        kept = [e for e in self.entries if e.pid != pid]
+        self.dirty |= len(kept) != len(self.entries)
+        self.entries = kept
 
-        if is_running(prev_pid):
-            if prev_app and prev_app in HYPRLAND_APPS:
-                kill_hyprland_window(HYPRLAND_APPS[prev_app])
-            kill_process_tree(prev_pid)
+def toggle(state, app, launcher=None):
+    """
+    Close app if it is open, otherwise close the tracked apps in its
+    exclusivity group and launch it, through launcher(app) when given and
+    it returns a process. Returns (closed entries, new Popen or None).
+    """
+    running = state.find(app)
+    group = APPS.group(app)
+    closed = [entry for entry in state.entries if APPS.group(entry.app) == group]
+    windows = close_apps(closed)
+    for entry in closed:
+        state.remove(entry.pid)
+    if not running:
+        HYPRLAND.wait_closed(windows)
+    HYPRLAND.release()
+    if running:
+        return closed, None
+    process = (launcher and launcher(app)) or launch(APPS[app].argv)
+    state.add(process.pid, app)
+    return closed, process
 
-        os.unlink(STATEFILE)
-        time.sleep(0.05)  # small buffer for Hyprland
-    except Exception:
+@TRACE.traced("launch")
+def launch(argv):
+    # Own session so the whole app can be torn down with one killpg
+    return subprocess.Popen(argv, start_new_session=True)
+
+def auto_kill(pid):
+    """Close the app at TIMEOUT unless something else already did"""
+    with StateStore() as state:
+        entry = state.get(pid)
+        if entry:
+            close_apps([entry])
+            HYPRLAND.release()
+            state.remove(pid)
+
+def forget_state(pid):
+    """Drop the app's entry as soon as it exits on its own"""
+    with StateStore() as state:
+        state.remove(pid)
+
+class Scheduler:
+    """
+    Auto-kill deadlines for every launched app in one heap, with a pidfd per
+    app on the selector so an exit is seen immediately and cancels its deadline
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.heap = []      # (deadline, pid), cancelled entries are skipped lazily
+        self.watched = {}   # pid -> (deadline, pidfd, on_expire, on_exit)
+
+    def watch(self, pid, deadline, on_expire, on_exit):
         try:
-            os.unlink(STATEFILE)
-        except:
-            pass
+            pidfd = os.pidfd_open(pid)
+            self.selector.register(pidfd, selectors.EVENT_READ, pid)
+        except (AttributeError, OSError):
+            pidfd = None  # no pidfd support, the deadline still applies
+        self.watched[pid] = (deadline, pidfd, on_expire, on_exit)
+        heapq.heappush(self.heap, (deadline, pid))
 
-def launch(command):
-    if isinstance(command, str):
-        return subprocess.Popen(shlex.split(command))
-    return subprocess.Popen(command)
+    def cancel(self, pid):
+        entry = self.watched.pop(pid, None)
+        if entry and entry[1] is not None:
+            self.selector.unregister(entry[1])
+            os.close(entry[1])
+        return entry
 
-def auto_kill_timer(pid, app_name):
-    time.sleep(TIMEOUT)
-    try:
-        if os.path.exists(STATEFILE):
-            with open(STATEFILE, 'r') as f:
-                data = f.read().strip()
-                if ',' in data:
-                    current_pid, current_app = data.split(',', 1)
-                    current_pid = int(current_pid)
+    def timeout(self):
+        """Seconds until the next live deadline, or None when nothing is pending"""
+        while self.heap:
+            deadline, pid = self.heap[0]
+            entry = self.watched.get(pid)
+            if entry and entry[0] == deadline:
+                return max(0.0, deadline - time.monotonic())
+            heapq.heappop(self.heap)
+        return None
+
+    def dispatch(self, events):
+        """Handle pidfd readiness from a select() result; other keys are ignored"""
+        for key, _ in events:
+            if isinstance(key.data, int):
+                entry = self.cancel(key.data)
+                if entry:
+                    entry[3](key.data)
+        while self.timeout() == 0.0:
+            _, pid = heapq.heappop(self.heap)
+            self.cancel(pid)[2](pid)
+
+    def run(self):
+        """Block until every watched app has exited or expired"""
+        while self.watched:
+            self.dispatch(self.selector.select(self.timeout()))
+
+@TRACE.traced("close")
+def close_apps(entries):
+    """Close the entries' windows in one batch, then their process trees"""
+    windows = HYPRLAND.close_windows(APPS.classes(e.app for e in entries))
+    for entry in entries:
+        kill_process_tree(entry.pid)
+    return windows
+
+# -----------------------------
+# Pre-warmed windows
+# -----------------------------
+class Shown:
+    """A pooled window handed out by a toggle; quacks like Popen for toggle()"""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+class Pool:
+    """
+    Hidden, ready windows for apps with a prewarm count, parked on POOL_WORKSPACE.
+    A toggle moves one onto the active workspace instead of starting a new
+    process and the pool is refilled behind it.
+    """
+
+    def __init__(self):
+        self.ready = {}    # app -> [(address, pid, parked at)]
+        self.pending = {}  # app -> spawned, window not seen yet
+        HYPRLAND.listeners.append(self.opened)
+
+    def fill(self, app):
+        spec = APPS.get(app)
+        if not spec or not spec.prewarm or not spec.klass or not HYPRLAND.events:
+            return
+        missing = spec.prewarm - len(self.ready.setdefault(app, [])) - self.pending.setdefault(app, 0)
+        for _ in range(missing):
+            self.pending[app] += 1
+            HYPRLAND.dispatch(f"exec [workspace {POOL_WORKSPACE} silent] {shlex.join(spec.argv)}")
+
+    def fill_all(self):
+        for app in APPS:
+            self.fill(app)
+
+    def opened(self, event, payload):
+        fields = payload.split(",", 3)
+        if event != "openwindow" or len(fields) != 4:
+            return
+        address, workspace, klass, _ = fields
+        app = next((a for a, n in self.pending.items() if n and APPS.get(a) and APPS[a].klass == klass), None)
+        if not app or workspace != POOL_WORKSPACE:
+            return
+        self.pending[app] -= 1
+        pid = next((c["pid"] for c in HYPRLAND.clients()
+                    if c["address"].removeprefix("0x") == address), None)
+        if pid:
+            self.ready[app].append((address, pid, time.monotonic()))
+            HYPRLAND.hidden.add(address)
+
+    @TRACE.traced("pool_take")
+    def take(self, app):
+        """Show a ready window of app on the active workspace, or return None"""
+        ready = self.ready.get(app, [])
+        while ready:
+            address, pid, _ = ready.pop(0)
+            if address not in HYPRLAND.hidden or not is_running(pid):
+                continue  # closed while parked
+            HYPRLAND.hidden.discard(address)
+            try:
+                workspace = json.loads(HYPRLAND.request("j/activeworkspace"))["id"]
+            except (ValueError, KeyError):
+                workspace = "e+0"
+            HYPRLAND.dispatch(f"movetoworkspace {workspace},address:0x{address}",
+                              f"focuswindow address:0x{address}")
+            self.fill(app)
+            return Shown(pid)
+        self.fill(app)
+        return None
+
+    def timeout(self):
+        parked = [since for ready in self.ready.values() for _, _, since in ready]
+        if not parked:
+            return None
+        return max(0.0, min(parked) + PREWARM_IDLE - time.monotonic())
+
+    def evict(self, everything=False):
+        """Kill windows parked longer than PREWARM_IDLE; they refill on the next toggle"""
+        now = time.monotonic()
+        for app, ready in self.ready.items():
+            for window in [w for w in ready if everything or now - w[2] >= PREWARM_IDLE]:
+                ready.remove(window)
+                HYPRLAND.hidden.discard(window[0])
+                HYPRLAND.dispatch(f"signalwindow address:0x{window[0]},9")
+                kill_process_tree(window[1])
+
+# -----------------------------
+# Daemon mode
+# -----------------------------
+class Daemon:
+    """Keeps the launched child in memory and serves toggles over SOCKET"""
+
+    def __init__(self):
+        self.children = {}  # pid -> Popen
+        self.selector = selectors.DefaultSelector()
+        self.scheduler = Scheduler(self.selector)
+        self.server = None
+        self.hyprland_events = None
+        HYPRLAND.persistent = True
+        self.pool = Pool()
+
+    def toggle(self, app):
+        with StateStore() as state:
+            closed, process = toggle(state, app, self.pool.take)
+        for entry in closed:
+            self.scheduler.cancel(entry.pid)
+            self.reap(entry.pid)
+        if not process:
+            return "closed"
+        if isinstance(process, subprocess.Popen):
+            self.children[process.pid] = process
+        self.scheduler.watch(process.pid, time.monotonic() + APPS[app].timeout,
+                             self.expired, self.exited)
+        return "shown" if isinstance(process, Shown) else "launched"
+
+    def watch_hyprland(self):
+        """Keep the event stream subscribed, reconnecting after Hyprland restarts"""
+        if self.hyprland_events and self.hyprland_events is not HYPRLAND.events:
+            self.selector.unregister(self.hyprland_events)
+            self.hyprland_events = None
+        if not self.hyprland_events and HYPRLAND.subscribe():
+            self.hyprland_events = HYPRLAND.events
+            self.selector.register(self.hyprland_events, selectors.EVENT_READ, "hyprland")
+            self.pool.fill_all()
+
+    def reap(self, pid):
+        child = self.children.pop(pid, None)
+        if child:
+            child.wait()
+
+    def exited(self, pid):
+        self.reap(pid)
+        forget_state(pid)
+
+    def expired(self, pid):
+        auto_kill(pid)
+        self.reap(pid)
+
+    def handle(self, conn):
+        try:
+            conn.settimeout(1.0)
+            with conn.makefile("rwb", buffering=0) as f:
+                words = f.readline().decode(errors="replace").split()
+                if APPS.refresh():
+                    self.pool.fill_all()
+                if words == ["ping"]:
+                    reply = "ok pong"
+                elif len(words) == 2 and words[0] == "toggle" and words[1] in APPS:
+                    TRACE.reset()
+                    try:
+                        reply = f"ok {self.toggle(words[1])}"
+                    except OSError as e:
+                        reply = f"err {e}"
+                    TRACE.flush("daemon", words[1], reply)
                 else:
-                    current_pid = int(data)
-                    current_app = None
+                    reply = "err usage: toggle <" + "|".join(APPS) + ">"
+                f.write(f"{reply}\n".encode())
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def serve(self):
+        try:
+            send_command("ping")
+            print(f"ui-launcher daemon already listening on {SOCKET}")
+            return 1
+        except OSError:
+            pass
+        try:
+            os.unlink(SOCKET)
+        except FileNotFoundError:
+            pass
 
-            if current_pid == pid:
-                if app_name in HYPRLAND_APPS:
-                    kill_hyprland_window(HYPRLAND_APPS[app_name])
-                kill_process_tree(pid)
+        signal.signal(signal.SIGTERM, lambda s, f: sys.exit(0))
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(SOCKET)
+            os.chmod(SOCKET, 0o600)
+            self.server.listen(16)
+            self.selector.register(self.server, selectors.EVENT_READ)
+            while True:
                 try:
-                    os.unlink(STATEFILE)
-                except:
-                    pass
-    except Exception:
-        pass
+                    self.step()
+                except Exception:
+                    # One bad request or event must not take the daemon down
+                    traceback.print_exc()
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            self.pool.evict(everything=True)
+            self.selector.close()
+            if self.server:
+                self.server.close()
+            try:
+                os.unlink(SOCKET)
+            except FileNotFoundError:
+                pass
 
-def main():
-    if len(sys.argv) != 2 or sys.argv[1] not in UI_APPS:
-        print(f"Usage: {sys.argv[0]} <app-name>")
-        print(f"Available: {', '.join(UI_APPS.keys())}")
-        sys.exit(1)
+    def step(self):
+        self.watch_hyprland()
+        timeouts = [t for t in (self.scheduler.timeout(), self.pool.timeout()) if t is not None]
+        events = self.selector.select(min(timeouts, default=None))
+        for key, _ in events:
+            if key.fileobj is self.server:
+                conn, _ = self.server.accept()
+                self.handle(conn)
+            elif key.data == "hyprland":
+                HYPRLAND.pump()
+        self.scheduler.dispatch(events)
+        self.pool.evict()
 
-    app = sys.argv[1]
-    command = UI_APPS[app]
-
-    # Toggle behavior: kill if same app running
-    if os.path.exists(STATEFILE):
-        try:
-            with open(STATEFILE, 'r') as f:
-                data = f.read().strip()
-                if ',' in data:
-                    prev_pid, prev_app = data.split(',', 1)
-                    prev_pid = int(prev_pid)
-                    if prev_app == app and is_running(prev_pid):
-                        kill_previous(app)
-                        return
-        except Exception:
-            pass
+def send_command(line, timeout=1.0):
+    """Send one request line to the daemon, raising OSError if none is listening"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(SOCKET)
+        sock.sendall(f"{line}\n".encode())
+        with sock.makefile("rb") as f:
+            return f.readline().decode().strip()
 
-    kill_previous(app)  # kill other apps if needed
-    process = launch(command)
-    pid = process.pid
+# -----------------------------
+# Benchmark
+# -----------------------------
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def wait_for_state(app, deadline):
+    while time.monotonic() < deadline:
+        with StateStore() as state:
+            if state.find(app):
+                return True
+        time.sleep(0.001)
+    return False
 
-    # Atomic write to state file
-    temp_statefile = f"{STATEFILE}.tmp"
+class StubProcess:
+    def __init__(self, pid):
+        self.pid = pid
+
+def stress_worker(path, pids, toggles, seed):
+    """
+    Run the real toggle() under the lock, with launching and closing stubbed
+    so every app maps to its own long-lived sleeper pid, and log the order
+    the lock was won in. Returns (latencies, entries seen that broke the rules).
+    """
+    import random
+    global launch, close_apps
+    by_argv = {tuple(APPS[app].argv): pid for app, pid in pids.items()}
+    launch = lambda argv: StubProcess(by_argv[tuple(argv)])
+    close_apps = lambda entries: set()
+    rng = random.Random(seed)
+    app_names = list(pids)
+    latencies, violations = [], 0
+    for _ in range(toggles):
+        app = rng.choice(app_names)
+        start = time.monotonic()
+        with StateStore(path) as state:
+            toggle(state, app)
+            groups = [APPS.group(e.app) for e in state.entries]
+            if len(set(groups)) < len(groups) or any(pids[e.app] != e.pid for e in state.entries):
+                violations += 1
+            with open(f"{path}.log", "a") as log:
+                log.write(f"{app}\n")
+        latencies.append(time.monotonic() - start)
+    return latencies, violations
+
+def bench_state(workers=200, toggles=20):
+    """Hammer toggle() and the state store from many processes and check nothing was lost"""
+    import tempfile
+    sleepers = {app: subprocess.Popen(["sleep", "3600"]) for app in APPS}
+    pids = {app: proc.pid for app, proc in sleepers.items()}
+    record = struct.Struct(f"{toggles}di")
     try:
-        with open(temp_statefile, 'w') as f:
-            f.write(f"{pid},{app}")
-        os.rename(temp_statefile, STATEFILE)
-    except Exception:
-        # Fallback to direct write
-        with open(STATEFILE, 'w') as f:
-            f.write(f"{pid},{app}")
-
-    timer_thread = threading.Thread(target=auto_kill_timer, args=(pid, app))
-    timer_thread.daemon = True  # Don't block exit
-    timer_thread.start()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state")
+            pipes, children = [], []
+            for seed in range(workers):
+                read_end, write_end = os.pipe()
+                child = os.fork()
+                if child == 0:
+                    status = 1
+                    try:
+                        os.close(read_end)
+                        latencies, violations = stress_worker(path, pids, toggles, seed)
+                        os.write(write_end, record.pack(*latencies, violations))
+                        status = 0
+                    finally:
+                        os._exit(status)
+                os.close(write_end)
+                pipes.append(read_end)
+                children.append(child)
+            runs = []
+            for read_end in pipes:
+                with os.fdopen(read_end, "rb") as f:
+                    data = f.read()
+                if len(data) == record.size:
+                    runs.append(record.unpack(data))
+            for child in children:
+                os.waitpid(child, 0)
+            with open(f"{path}.log") as log:
+                order = log.read().split()
+            with StateStore(path) as state:
+                final = sorted((e.app, e.pid) for e in state.entries)
+    finally:
+        for proc in sleepers.values():
+            proc.kill()
+            proc.wait()
+
+    # Replaying the toggles in lock order must land on the same state
+    expected = []
+    for app in order:
+        others = [e for e in expected if APPS.group(e[0]) != APPS.group(app)]
+        expected = others if (app, pids[app]) in expected else others + [(app, pids[app])]
+    expected.sort()
+    latencies = [t for run in runs for t in run[:-1]]
+    violations = sum(run[-1] for run in runs)
+    ok = (len(runs) == workers and len(order) == workers * toggles
+          and not violations and final == expected)
+    print(f"{len(runs)}/{workers} workers finished, {len(order)}/{workers * toggles} toggles logged, "
+          f"{violations} bad intermediate states")
+    print(f"final {final}, expected {expected}")
+    if latencies:
+        print(f"toggle latency p50 {percentile(latencies, 50) * 1000:.2f}ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.2f}ms")
+    print("ok" if ok else "FAILED: lost or stale entries")
+    return 0 if ok else 1
+
+TREE_NODE = """
+import os, sys, time
+def grow(depth, width):
+    for _ in range(width if depth else 0):
+        if os.fork() == 0:
+            if depth % 2:
+                os.setsid()  # mimic terminals that put their shell in a new session
+            grow(depth - 1, width)
+    time.sleep(3600)
+grow(int(sys.argv[1]), int(sys.argv[2]))
+"""
+
+def bench_tree(depth=4, width=3, max_ms=500, rounds=5):
+    """
+    Time kill_process_tree against a synthetic depth x width tree; fails on
+    leaked processes or when a teardown takes longer than max_ms
+    """
+    expected = sum(width ** level for level in range(depth + 1))
+    samples = []
+    for _ in range(rounds):
+        root = subprocess.Popen([sys.executable, "-c", TREE_NODE, str(depth), str(width)],
+                                start_new_session=True)
+        deadline = time.monotonic() + 10.0
+        tree = [root.pid]
+        while len(tree) < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+            children = process_children()
+            tree = [root.pid]
+            for node in tree:
+                tree.extend(children.get(node, ()))
+        if len(tree) < expected:
+            print(f"tree only grew to {len(tree)}/{expected} processes")
+            kill_process_tree(root.pid)
+            root.wait()
+            return 1
+        start = time.monotonic()
+        kill_process_tree(root.pid)
+        samples.append(time.monotonic() - start)
+        root.wait()
+        leaked = [node for node in tree if is_running(node)]
+        if leaked:
+            print(f"{len(leaked)} processes survived teardown: {leaked[:10]}")
+            return 1
+    print(f"{expected} processes (depth {depth}, width {width}): "
+          f"p50 {percentile(samples, 50) * 1000:.1f}ms, max {max(samples) * 1000:.1f}ms")
+    if max(samples) * 1000 > max_ms:
+        print(f"FAILED: teardown exceeded the {max_ms}ms bound")
+        return 1
+    return 0
+
+class FakeHyprland:
+    """Serves .socket.sock/.socket2.sock from a temp dir in place of Hyprland"""
+
+    def __init__(self, base, windows):
+        import threading
+        self.base = base
+        self.windows = dict(windows)  # address -> class
+        self.requests = []
+        self.subscribers = []
+        self.sockets = []
+        for name, handler in ((".socket.sock", self.command), (".socket2.sock", self.subscribers.append)):
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(os.path.join(base, name))
+            server.listen(8)
+            self.sockets.append(server)
+            threading.Thread(target=self.serve, args=(server, handler), daemon=True).start()
+
+    def serve(self, server, handler):
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            handler(conn)
+
+    def emit(self, line):
+        for conn in self.subscribers:
+            conn.sendall(f"{line}\n".encode())
+
+    def command(self, conn):
+        import threading
+        with conn:
+            request = conn.recv(65536).decode()
+            self.requests.append(request)
+            if request == "j/clients":
+                conn.sendall(json.dumps([{"address": f"0x{a}", "class": c}
+                                         for a, c in self.windows.items()]).encode())
+                return
+            conn.sendall(b"ok")
+        doomed = [part.removeprefix("dispatch signalwindow address:0x").split(",")[0]
+                  for part in request.removeprefix("[[BATCH]]").split(";")
+                  if part.startswith("dispatch signalwindow address:0x")]
+        doomed = [a for a in doomed if a in self.windows]
+        for address in doomed:
+            del self.windows[address]
 
+        def close_later():
+            time.sleep(0.03)
+            for address in doomed:
+                self.emit(f"closewindow>>{address}")
+        threading.Thread(target=close_later, daemon=True).start()
+
+    def close(self):
+        for sock in self.sockets + self.subscribers:
+            sock.close()
+
+def bench_hyprland():
+    """Check the IPC client against a fake Hyprland on local sockets"""
+    import tempfile
+    failures = []
+    with tempfile.TemporaryDirectory() as base:
+        fake = FakeHyprland(base, {"a1": "clipse", "a2": "waypaper", "a3": "kitty"})
+        hypr = Hyprland(base)
+        try:
+            hypr.subscribe()
+            if hypr.windows != {"a1": "clipse", "a2": "waypaper", "a3": "kitty"}:
+                failures.append(f"seeded window map is {hypr.windows}")
+
+            fake.windows["a4"] = "clipse"
+            fake.emit("openwindow>>a4,1,clipse,title, with commas")
+            fake.emit("openwindow>>broken")
+            del fake.windows["a3"]
+            fake.emit("closewindow>>a3")
+            deadline = time.monotonic() + 1.0
+            while time.monotonic() < deadline and ("a4" not in hypr.windows or "a3" in hypr.windows):
+                select.select([hypr.events], [], [], 0.05)
+                hypr.pump()
+            if hypr.windows != {"a1": "clipse", "a2": "waypaper", "a4": "clipse"}:
+                failures.append(f"window map after events is {hypr.windows}")
+
+            before = len(fake.requests)
+            addresses = hypr.close_windows({"clipse", "waypaper"})
+            sent = fake.requests[before:]
+            if addresses != {"a1", "a2", "a4"}:
+                failures.append(f"close_windows returned {addresses}")
+            if len(sent) != 1 or not sent[0].startswith("[[BATCH]]") or sent[0].count("dispatch") != 3:
+                failures.append(f"expected one [[BATCH]] request, sent {sent}")
+
+            start = time.monotonic()
+            hypr.wait_closed(addresses, timeout=2.0)
+            waited = time.monotonic() - start
+            if waited > 1.0:
+                failures.append(f"wait_closed took {waited * 1000:.0f}ms, closewindow was ignored")
+            if hypr.windows:
+                failures.append(f"windows left open: {hypr.windows}")
+        finally:
+            hypr.unsubscribe()
+            fake.close()
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if not failures:
+        print(f"ok (wait_closed returned after {waited * 1000:.1f}ms)")
+    return 1 if failures else 0
+
+def bench_window(app, rounds=10):
+    """Time from toggle to a visible window: one-shot launch vs the daemon's pool"""
+    klass = APPS[app].klass
+    hypr = Hyprland()
+    if not klass or not hypr.subscribe():
+        print("bench window needs a running Hyprland and an app with a window class")
+        return 1
+    try:
+        send_command("ping")
+    except OSError:
+        print("bench window needs a running daemon: ui-launcher.py daemon")
+        return 1
+    script = os.path.abspath(__file__)
+    client = os.path.join(os.path.dirname(script), "ui-toggle")
+    cold_env = dict(os.environ, UI_LAUNCHER_SOCKET=f"{SOCKET}.bench-cold")
+    shown = []
+
+    def visible(event, payload):
+        fields = payload.split(",")
+        if event == "openwindow" and len(fields) >= 3 and fields[2] == klass:
+            workspace = fields[1]
+        elif event == "movewindowv2" and len(fields) >= 3 and hypr.windows.get(fields[0]) == klass:
+            workspace = fields[2]
+        else:
+            return
+        if not workspace.startswith("special:"):
+            shown.append(time.monotonic())
+    hypr.listeners.append(visible)
+
+    def time_to_window(start):
+        shown.clear()
+        deadline = start + 5.0
+        while not shown and time.monotonic() < deadline:
+            select.select([hypr.events], [], [], max(0.0, deadline - time.monotonic()))
+            hypr.pump()
+        return shown[0] - start if shown else None
+
+    results = {"cold": [], "pool": []}
+    try:
+        for _ in range(rounds):
+            start = time.monotonic()
+            waiter = subprocess.Popen([sys.executable, script, app], env=cold_env)
+            results["cold"].append(time_to_window(start))
+            subprocess.run([sys.executable, script, app], env=cold_env)
+            waiter.wait()
+
+            time.sleep(1.0)  # let the pool refill behind the previous toggle
+            start = time.monotonic()
+            subprocess.run([client, app])
+            results["pool"].append(time_to_window(start))
+            subprocess.run([client, app])
+    finally:
+        hypr.unsubscribe()
+
+    for mode, samples in results.items():
+        ok = [t for t in samples if t is not None]
+        if not ok:
+            print(f"{mode:<5} no window seen")
+            continue
+        print(f"{mode:<5} time to visible window p50 {percentile(ok, 50) * 1000:.1f}ms, "
+              f"p95 {percentile(ok, 95) * 1000:.1f}ms ({len(samples) - len(ok)} missed)")
+    return 0
+
+def bench(app, rounds):
+    """Time open/close toggles through the one-shot path and the daemon"""
+    script = os.path.abspath(__file__)
+
+    client = os.path.join(os.path.dirname(script), "ui-toggle")
+    results = {}
+
+    # Point one-shot runs at a dead socket so a running daemon is bypassed
+    cold_env = dict(os.environ, UI_LAUNCHER_SOCKET=f"{SOCKET}.bench-cold")
+    opened, closed = [], []
+    for _ in range(rounds):
+        start = time.monotonic()
+        waiter = subprocess.Popen([sys.executable, script, app], env=cold_env)
+        if not wait_for_state(app, start + 5.0):
+            waiter.kill()
+            waiter.wait()
+            print(f"{app} did not launch within 5s")
+            return 1
+        opened.append(time.monotonic() - start)
+        start = time.monotonic()
+        subprocess.run([sys.executable, script, app], env=cold_env)
+        closed.append(time.monotonic() - start)
+        waiter.wait()
+    results["cold"] = (opened, closed)
+
+    daemon = None
     try:
-        # Wait for process to finish or be killed
+        send_command("ping")
+    except OSError:
+        daemon = subprocess.Popen([sys.executable, script, "daemon"])
+        deadline = time.monotonic() + 5.0
+        while True:
+            try:
+                send_command("ping")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    print("daemon did not come up within 5s")
+                    daemon.kill()
+                    return 1
+                time.sleep(0.01)
+    if not shutil.which("socat"):
+        print("socat not found, ui-toggle will fall back to the one-shot path")
+    try:
+        # Time the client the keybinds run, not an in-process send_command
+        opened, closed = [], []
+        for _ in range(rounds):
+            for samples in (opened, closed):
+                start = time.monotonic()
+                subprocess.run([client, app], check=True)
+                samples.append(time.monotonic() - start)
+        results["daemon"] = (opened, closed)
+    finally:
+        if daemon:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f"{'mode':<8} {'open p50':>10} {'open p95':>10} {'close p50':>10} {'close p95':>10}")
+    for mode, (opened, closed) in results.items():
+        row = [percentile(s, p) * 1000 for s in (opened, closed) for p in (50, 95)]
+        print(f"{mode:<8} " + " ".join(f"{v:>8.1f}ms" for v in row))
+    return 0
+
+def stats():
+    """Print p50/p95/p99 of every traced phase, over all toggles and per app"""
+    records = []
+    for path in (f"{TRACE_LOG}.1", TRACE_LOG):
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # a line torn by a crash
+        except FileNotFoundError:
+            pass
+    if not records:
+        print(f"No traces in {TRACE_LOG}; set UI_LAUNCHER_TRACE=1 or pass --trace")
+        return 1
+
+    groups = {"all": records}
+    for record in records:
+        groups.setdefault(f"{record['app']} ({record['mode']})", []).append(record)
+    print(f"{'':<32}{'phase':<16}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, group in groups.items():
+        phases = {}
+        for record in group:
+            for phase, ms in record["phases"].items():
+                phases.setdefault(phase, []).append(ms)
+        for phase in sorted(phases, key=lambda p: (p == "total", p)):
+            samples = phases[phase]
+            print(f"{name:<32}{phase:<16}{len(samples):>6}"
+                  + "".join(f"{percentile(samples, pct):>8.2f}ms" for pct in (50, 95, 99)))
+            name = ""
+    return 0
+
+def usage():
+    print(f"Usage: {sys.argv[0]} [--trace] <app-name> | daemon | stats | bench <app-name> [rounds]"
+          " | bench window <app-name> [rounds] | bench tree [depth] [width] [max-ms] | bench state [workers] [toggles] | bench hyprland")
+    print(f"Available: {', '.join(APPS)}")
+    sys.exit(1)
+
+def main():
+    args = sys.argv[1:]
+    if "--trace" in args:
+        args.remove("--trace")
+        TRACE.enabled = True
+    if TRACE.enabled:
+        TRACE.add("startup", process_age() - (time.monotonic() - TRACE.start))
+    if args == ["stats"]:
+        sys.exit(stats())
+    if args == ["daemon"]:
+        sys.exit(Daemon().serve())
+    if 2 <= len(args) <= 5 and args[:2] == ["bench", "tree"]:
+        sys.exit(bench_tree(*[int(a) for a in args[2:]]))
+    if len(args) in (3, 4) and args[:2] == ["bench", "window"] and args[2] in APPS:
+        sys.exit(bench_window(args[2], *[int(a) for a in args[3:]]))
+    if args == ["bench", "hyprland"]:
+        sys.exit(bench_hyprland())
+    if 2 <= len(args) <= 4 and args[:2] == ["bench", "state"]:
+        sys.exit(bench_state(*[int(a) for a in args[2:]]))
+    if len(args) in (2, 3) and args[0] == "bench" and args[1] in APPS:
+        sys.exit(bench(args[1], int(args[2]) if len(args) == 3 else 10))
+    if len(args) != 1 or args[0] not in APPS:
+        usage()
+
+    app = args[0]
+
+    # Hand the toggle to a running daemon if there is one. Only a failed
+    # connect falls back: once the request is sent the daemon owns it.
+    try:
+        with TRACE.phase("daemon"):
+            reply = send_command(f"toggle {app}", timeout=TOGGLE_TIMEOUT)
+    except (FileNotFoundError, ConnectionRefusedError):
+        reply = None
+    except OSError as e:
+        print(f"ui-launcher daemon did not answer: {e}")
+        sys.exit(1)
+    if reply is not None:
+        if not reply.startswith("ok"):
+            print(f"ui-launcher daemon: {reply}")
+            sys.exit(1)
+        TRACE.flush("client", app, reply, process_age())
+        return
+
+    with StateStore() as state:
+        _, process = toggle(state, app)
+    TRACE.flush("oneshot", app, "launched" if process else "closed", process_age())
+    if not process:
+        return
+    pid = process.pid
+
+    def exited(pid):
+        process.wait()
+        forget_state(pid)
+
+    def expired(pid):
+        auto_kill(pid)
         process.wait()
+
+    scheduler = Scheduler(selectors.DefaultSelector())
+    scheduler.watch(pid, time.monotonic() + APPS[app].timeout, expired, exited)
+    try:
+        # Sleep until the app exits, is killed by another toggle, or expires
+        scheduler.run()
     except KeyboardInterrupt:
-        if app in HYPRLAND_APPS:
-            kill_hyprland_window(HYPRLAND_APPS[app])
-        kill_process_tree(pid)
-        if os.path.exists(STATEFILE):
-            try:
-                os.unlink(STATEFILE)
-            except:
-                pass
+        auto_kill(pid)
+        process.wait()
 
 if __name__ == "__main__":
     main()